@@ -0,0 +1,364 @@
+# ann_index.py
+"""
+Recherche approchée des plus proches voisins (ANN) pour les grandes
+galeries, en NumPy pur : index IVF (inverted file).
+
+- construction : k-means (quantificateur grossier) sur un échantillon de
+  la galerie, puis chaque référence est rangée dans la liste de son
+  centroïde le plus proche ; les vecteurs sont recopiés liste par liste
+  pour que chaque liste soit un bloc contigu ;
+- requête : on ne parcourt que les `nprobe` listes dont le centroïde est
+  le plus proche, avec une distance exacte sur ces candidats. Les requêtes
+  d'un lot sont regroupées par liste : chaque liste est lue une seule fois
+  pour toutes les requêtes qui la sondent ;
+- ajout : les nouveaux vecteurs sont rangés dans la liste de leur centroïde
+  le plus proche, sans nouveau k-means. On réentraîne à la demande (build),
+  ou quand la galerie a trop grandi depuis l'entraînement (`max_growth`)
+  ou que les ajouts sont nettement plus loin de leurs centroïdes que la
+  galerie d'entraînement (`max_drift`, erreur de quantification moyenne).
+
+Réglages rappel / vitesse : `n_lists` (plus de listes = listes plus
+courtes) et `nprobe` (plus de listes parcourues = meilleur rappel).
+nprobe = n_lists redonne la recherche exacte.
+
+    ReferenceIndex(backend="ivf", ann_options={"n_lists": 512, "nprobe": 8})
+    python ann_index.py --size 200000 --dim 70     # rappel vs latence
+"""
+import time
+
+import numpy as np
+
+# Taille max (en float32) d'un bloc de calcul de distances
+_BLOCK_ELEMENTS = 1 << 22
+
+
+def _sq_distances(x, centroids, c_norms):
+    """Distances au carré (n, k) via |x|² - 2 x.c + |c|²."""
+    d = np.einsum("ij,ij->i", x, x)[:, None] - 2.0 * (x @ centroids.T) + c_norms[None, :]
+    return np.maximum(d, 0.0, out=d)
+
+
+def nearest_centroid(x, centroids):
+    """Indice du centroïde le plus proche de chaque ligne, par blocs."""
+    c_norms = np.einsum("ij,ij->i", centroids, centroids)
+    labels = np.empty(len(x), dtype=np.intp)
+    step = max(1, _BLOCK_ELEMENTS // max(1, len(centroids)))
+    for start in range(0, len(x), step):
+        block = _sq_distances(x[start:start + step], centroids, c_norms)
+        labels[start:start + step] = block.argmin(axis=1)
+    return labels
+
+
+def residuals(x, centroids, labels):
+    """Somme, par dimension, des carrés des écarts à son centroïde (d,)."""
+    diff = x - centroids[labels]
+    return np.einsum("ij,ij->j", diff, diff, dtype=np.float64)
+
+
+def kmeans(data, n_clusters, iterations=10, seed=0):
+    """k-means de Lloyd ; les clusters vides sont réinitialisés au hasard."""
+    rng = np.random.default_rng(seed)
+    data = np.asarray(data, dtype=np.float32)
+    centroids = data[rng.choice(len(data), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        labels = nearest_centroid(data, centroids)
+        counts = np.bincount(labels, minlength=n_clusters)
+        sums = np.zeros_like(centroids, dtype=np.float64)
+        np.add.at(sums, labels, data)
+        filled = counts > 0
+        centroids[filled] = (sums[filled] / counts[filled, None]).astype(np.float32)
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+    return centroids
+
+
+class IVFIndex:
+    """
+    Index IVF sur une matrice float32 (n, d).
+    n_lists : nombre de listes (None = environ sqrt(n)).
+    nprobe : listes parcourues par requête (modifiable à tout moment).
+    train_size : nombre max de vecteurs utilisés pour le k-means.
+    max_growth : réentraîner (needs_retrain) quand l'index dépasse
+    max_growth fois la taille de la galerie d'entraînement.
+    max_drift : réentraîner quand l'erreur de quantification moyenne des
+    vecteurs ajoutés dépasse max_drift fois celle de l'entraînement.
+    """
+
+    def __init__(self, n_lists=None, nprobe=8, iterations=10, train_size=65536, seed=0,
+                 max_growth=2.0, max_drift=1.5):
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.train_size = train_size
+        self.seed = seed
+        self.max_growth = max_growth
+        self.max_drift = max_drift
+        self.centroids = None
+        self.order = None    # ligne d'origine de chaque vecteur rangé
+        self.offsets = None  # liste l = vectors[offsets[l]:offsets[l + 1]]
+        self.vectors = None
+        self.trained_size = 0
+        self.train_residual = None  # erreur moyenne par dimension à l'entraînement
+        self.added = 0              # vecteurs ajoutés depuis l'entraînement
+        self.added_residual = None  # somme de leurs erreurs par dimension
+
+    def __len__(self):
+        return 0 if self.order is None else len(self.order)
+
+    # ---------- Construction ----------
+
+    def build(self, matrix):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        n = len(matrix)
+        n_lists = self.n_lists or max(1, int(round(np.sqrt(n))))
+        n_lists = max(1, min(n_lists, n))
+
+        rng = np.random.default_rng(self.seed)
+        train = matrix
+        if n > self.train_size:
+            train = matrix[np.sort(rng.choice(n, self.train_size, replace=False))]
+        centroids = kmeans(train, n_lists, self.iterations, self.seed)
+        labels = self._assign(matrix, centroids)
+        self.trained_size = n
+        self.train_residual = residuals(matrix, centroids, labels) / n
+        self.added = 0
+        self.added_residual = np.zeros_like(self.train_residual)
+        return self
+
+    def _assign(self, matrix, centroids):
+        labels = nearest_centroid(matrix, centroids)
+        self.centroids = centroids
+        self.order = np.argsort(labels, kind="stable")
+        self.offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(labels, minlength=len(centroids)))]
+        ).astype(np.intp)
+        self.vectors = np.ascontiguousarray(matrix[self.order])
+        return labels
+
+    def add(self, vectors):
+        """
+        Ajoute des vecteurs (lignes len(self), len(self) + 1, ... de la
+        matrice d'origine) à la fin de la liste de leur centroïde le plus
+        proche. Pas de k-means : O(n) copies, voir needs_retrain.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.centroids.shape[1])
+        labels = nearest_centroid(vectors, self.centroids)
+        by_list = np.argsort(labels, kind="stable")
+        labels = labels[by_list]
+        rows = len(self) + by_list
+        # np.insert garde l'ordre des valeurs insérées à une même position
+        at = self.offsets[labels + 1]
+        self.vectors = np.insert(self.vectors, at, vectors[by_list], axis=0)
+        self.order = np.insert(self.order, at, rows)
+        self.offsets[1:] += np.cumsum(np.bincount(labels, minlength=len(self.centroids)))
+        self.added += len(vectors)
+        self.added_residual += residuals(vectors[by_list], self.centroids, labels)
+        return self
+
+    def rescale(self, factor, matrix):
+        """
+        Change d'échelle (normalisation recalculée) sans réentraîner : les
+        centroïdes sont multipliés par `factor` (moyennes des vecteurs
+        remis à l'échelle) et les vecteurs relus dans `matrix`, déjà à la
+        nouvelle échelle (mêmes lignes que l'index).
+        """
+        factor = np.asarray(factor, dtype=np.float32)
+        if np.array_equal(factor, np.ones_like(factor)):
+            return self
+        self.centroids = self.centroids * factor
+        self.vectors = np.ascontiguousarray(np.asarray(matrix, dtype=np.float32)[self.order])
+        self.train_residual = self.train_residual * np.square(factor, dtype=np.float64)
+        self.added_residual = self.added_residual * np.square(factor, dtype=np.float64)
+        return self
+
+    def needs_retrain(self):
+        """Vrai si la galerie a trop grandi ou dérivé depuis le dernier k-means."""
+        if len(self) > self.max_growth * self.trained_size:
+            return True
+        if self.added == 0:
+            return False
+        drift = self.added_residual.sum() / self.added
+        return drift > self.max_drift * max(self.train_residual.sum(), 1e-12)
+
+    # ---------- Requêtes ----------
+
+    def search(self, queries, k=1, nprobe=None):
+        """
+        k voisins approchés de chaque requête : (distances, indices) (m, k),
+        indices dans la matrice d'origine. Les lignes sans assez de
+        candidats sont complétées par inf / -1.
+        """
+        q = np.asarray(queries, dtype=np.float32).reshape(-1, self.centroids.shape[1])
+        nprobe = max(1, min(nprobe or self.nprobe, len(self.centroids)))
+        c_norms = np.einsum("ij,ij->i", self.centroids, self.centroids)
+        coarse = _sq_distances(q, self.centroids, c_norms)
+        if nprobe < len(self.centroids):
+            probes = np.argpartition(coarse, nprobe - 1, axis=1)[:, :nprobe]
+        else:
+            probes = np.broadcast_to(np.arange(len(self.centroids)), coarse.shape)
+
+        # k meilleurs candidats de chaque (requête, liste sondée), puis
+        # sélection finale parmi les nprobe * k candidats de chaque requête
+        cand_dist = np.full((len(q), nprobe * k), np.inf, dtype=np.float32)
+        cand_pos = np.full((len(q), nprobe * k), -1, dtype=np.intp)
+        flat = probes.ravel()
+        by_list = np.argsort(flat, kind="stable")
+        lists, starts = np.unique(flat[by_list], return_index=True)
+        bounds = np.append(starts, len(flat))
+        for l, a, b in zip(lists, bounds[:-1], bounds[1:]):
+            lo, hi = self.offsets[l], self.offsets[l + 1]
+            if lo == hi:
+                continue
+            rows, slots = np.divmod(by_list[a:b], nprobe)
+            d = self._list_distances(q[rows], lo, hi)
+            kk = min(k, hi - lo)
+            if kk < hi - lo:
+                best = np.argpartition(d, kk - 1, axis=1)[:, :kk]
+            else:
+                best = np.broadcast_to(np.arange(hi - lo), d.shape)
+            cols = slots[:, None] * k + np.arange(kk)
+            cand_dist[rows[:, None], cols] = np.take_along_axis(d, best, axis=1)
+            cand_pos[rows[:, None], cols] = lo + best
+
+        if k < cand_dist.shape[1]:
+            best = np.argpartition(cand_dist, k - 1, axis=1)[:, :k]
+        else:
+            best = np.broadcast_to(np.arange(k), cand_dist.shape)
+        best = np.take_along_axis(
+            best, np.argsort(np.take_along_axis(cand_dist, best, axis=1), axis=1, kind="stable"),
+            axis=1,
+        )
+        dist = np.take_along_axis(cand_dist, best, axis=1)
+        pos = np.take_along_axis(cand_pos, best, axis=1)
+        idx = np.where(pos >= 0, self.order[np.maximum(pos, 0)], -1)
+        return dist, idx
+
+    def _list_distances(self, q, lo, hi):
+        """Distances exactes (m, hi - lo) entre des requêtes et une liste, par blocs."""
+        vectors = self.vectors[lo:hi]
+        out = np.empty((len(q), hi - lo), dtype=np.float32)
+        step = max(1, _BLOCK_ELEMENTS // max(1, vectors.size))
+        for start in range(0, len(q), step):
+            diff = q[start:start + step, None, :] - vectors[None, :, :]
+            np.sqrt(np.einsum("ijk,ijk->ij", diff, diff), out=out[start:start + step])
+        return out
+
+    # ---------- Sérialisation ----------
+
+    def save(self, path):
+        """Enregistre le quantificateur et les listes (pas les vecteurs)."""
+        np.savez(
+            path, centroids=self.centroids, order=self.order, offsets=self.offsets,
+            params=np.array([self.nprobe, self.iterations, self.train_size, self.seed]),
+            drift=np.array([self.max_growth, self.max_drift, self.trained_size, self.added]),
+            residuals=np.stack([self.train_residual, self.added_residual]),
+        )
+
+    @classmethod
+    def load(cls, path, matrix):
+        """
+        Recharge un index enregistré ; `matrix` doit être la matrice
+        utilisée à la construction (mêmes lignes, même ordre).
+        """
+        with np.load(path) as data:
+            nprobe, iterations, train_size, seed = (int(v) for v in data["params"])
+            index = cls(len(data["centroids"]), nprobe, iterations, train_size, seed)
+            index.centroids = data["centroids"]
+            index.order = data["order"]
+            index.offsets = data["offsets"]
+            if "drift" in data:
+                index.max_growth, index.max_drift = (float(v) for v in data["drift"][:2])
+                index.trained_size, index.added = (int(v) for v in data["drift"][2:])
+                index.train_residual, index.added_residual = data["residuals"]
+            else:
+                # Ancien format : considéré comme entraîné sur tout l'index
+                index.trained_size = len(index.order)
+                index.train_residual = np.full(index.centroids.shape[1], np.inf)
+                index.added_residual = np.zeros(index.centroids.shape[1])
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if len(matrix) != len(index.order):
+            raise ValueError(
+                f"Index IVF construit pour {len(index.order)} lignes, matrice de {len(matrix)}."
+            )
+        index.vectors = np.ascontiguousarray(matrix[index.order])
+        return index
+
+
+# -------- Rapport rappel / latence --------
+
+def exact_search(matrix, queries, k=1):
+    """Référence exacte (même calcul que ReferenceIndex, backend numpy)."""
+    c_norms = np.einsum("ij,ij->i", matrix, matrix)
+    d = _sq_distances(np.asarray(queries, dtype=np.float32), matrix, c_norms)
+    idx = np.argsort(d, axis=1)[:, :k]
+    return np.sqrt(np.take_along_axis(d, idx, axis=1)), idx
+
+
+def recall_report(matrix, queries, k=10, n_lists=None, nprobes=(1, 2, 4, 8, 16, 32)):
+    """
+    Compare l'IVF à la recherche exacte : pour chaque nprobe, rappel@k
+    (part des k vrais voisins retrouvés) et latence moyenne par requête.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    queries = np.asarray(queries, dtype=np.float32)
+
+    t0 = time.perf_counter()
+    _, truth = exact_search(matrix, queries, k)
+    exact_ms = 1000 * (time.perf_counter() - t0) / len(queries)
+
+    t0 = time.perf_counter()
+    ivf = IVFIndex(n_lists).build(matrix)
+    build_s = time.perf_counter() - t0
+
+    rows = []
+    for nprobe in nprobes:
+        if nprobe > len(ivf.centroids):
+            break
+        t0 = time.perf_counter()
+        _, idx = ivf.search(queries, k, nprobe)
+        ms = 1000 * (time.perf_counter() - t0) / len(queries)
+        hits = sum(len(np.intersect1d(a, b)) for a, b in zip(idx, truth))
+        rows.append({"nprobe": nprobe, "recall": hits / truth.size, "latency_ms": ms,
+                     "speedup": exact_ms / ms if ms > 0 else float("inf")})
+    return {"size": len(matrix), "dim": matrix.shape[1], "k": k,
+            "n_lists": len(ivf.centroids), "build_s": build_s,
+            "exact_ms": exact_ms, "rows": rows}
+
+
+def clustered_vectors(size, dim, clusters=64, seed=0):
+    """Vecteurs de test regroupés (plus réaliste qu'un bruit uniforme)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0, 10, (clusters, dim))
+    labels = rng.integers(0, clusters, size)
+    return (centers[labels] + rng.normal(0, 1, (size, dim))).astype(np.float32)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Rappel vs latence de l'index IVF")
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=3,
+                        help="3 = features de base (galerie synthétique), sinon vecteurs regroupés")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--lists", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.dim == 3:
+        from reference_db import ReferenceIndex
+        from synthetic_signatures import synthetic_gallery
+        index = ReferenceIndex.from_references(synthetic_gallery(args.size + args.queries),
+                                               normalize=True)
+        data = index._scaled
+    else:
+        data = clustered_vectors(args.size + args.queries, args.dim)
+    matrix, queries = data[:args.size], data[args.size:]
+
+    report = recall_report(matrix, queries, args.k, args.lists)
+    print(f"{report['size']} vecteurs, dim {report['dim']}, {report['n_lists']} listes "
+          f"(construction {report['build_s']:.2f} s) ; exact : {report['exact_ms']:.3f} ms/requête")
+    for row in report["rows"]:
+        print(f"  nprobe {row['nprobe']:3d}  rappel@{report['k']} {row['recall']:6.1%}  "
+              f"{row['latency_ms']:7.3f} ms/requête  (x{row['speedup']:.1f})")
@@ -0,0 +1,195 @@
+# audit_log.py
+"""
+Journal d'audit des vérifications : une ligne JSON UTF-8 par événement,
+écrite par un thread d'arrière-plan.
+
+- le thread appelant ne fait que déposer l'enregistrement dans une file
+  (aucun formatage, aucune écriture disque) ;
+- le thread d'écriture vide la file par lots et ne vide le tampon du
+  fichier qu'une fois par lot ;
+- rotation par taille (RotatingFileHandler) ou par date
+  (TimedRotatingFileHandler, paramètre `when`).
+
+    from audit_log import audit_event, get_audit_logger
+    audit_event(get_audit_logger(), logging.INFO, "verification", match=True)
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+AUDIT_LOGGER = "signature.audit"
+LOG_FILE = "verification.log"
+
+
+class JsonFormatter(logging.Formatter):
+    """Enregistrement -> ligne JSON (champs structurés dans record.fields)."""
+
+    def format(self, record):
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created))
+                    + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "event": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler qui laisse tout le formatage au thread d'écriture et
+    abandonne l'événement (compteur `dropped`) si la file est pleine.
+    """
+
+    dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BatchWriter:
+    """
+    Thread qui lit la file et écrit les enregistrements par lots dans un
+    handler fichier (avec sa rotation), puis vide le tampon une fois par lot.
+    """
+
+    def __init__(self, records, handler, batch_size=64, flush_interval=0.5):
+        self.records = records
+        self.handler = handler
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._stop = object()
+        self._thread = threading.Thread(target=self._run, name="audit-log", daemon=True)
+        self._thread.start()
+
+    def _needs_rollover(self, record, line):
+        """Rotation nécessaire avant d'écrire `line` (déjà formatée) ?"""
+        h = self.handler
+        if isinstance(h, logging.handlers.RotatingFileHandler):
+            # Même test que shouldRollover, sans reformater l'enregistrement
+            size = len(line.encode(h.encoding or "utf-8"))
+            return h.maxBytes > 0 and h.stream.tell() + size >= h.maxBytes
+        return h.shouldRollover(record)  # rotation par date : aucun formatage
+
+    def _write_batch(self, batch):
+        h = self.handler
+        with h.lock:
+            for record in batch:
+                try:
+                    line = h.format(record) + h.terminator
+                    if self._needs_rollover(record, line):
+                        h.doRollover()  # rouvre le flux (handler créé avec delay=False)
+                    h.stream.write(line)
+                except Exception:
+                    h.handleError(record)
+            h.stream.flush()
+
+    def _run(self):
+        while True:
+            try:
+                first = self.records.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch, stop = [], first is self._stop
+            if not stop:
+                batch.append(first)
+            while len(batch) < self.batch_size and not stop:
+                try:
+                    item = self.records.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._stop:
+                    stop = True
+                else:
+                    batch.append(item)
+            if batch:
+                self._write_batch(batch)
+            if stop:
+                return
+
+    def stop(self):
+        self.records.put(self._stop)
+        self._thread.join()
+        self.handler.close()
+
+
+_writer = None
+_lock = threading.RLock()
+
+
+def setup_audit_log(path=LOG_FILE, level=logging.INFO, max_bytes=5 * 1024 * 1024,
+                    backup_count=5, when=None, batch_size=64, flush_interval=0.5,
+                    max_queue=10000):
+    """
+    Configure (ou reconfigure) le logger d'audit et démarre le thread d'écriture.
+    when : si fourni ("midnight", "H"...), rotation par date au lieu de la taille.
+    max_queue : au-delà, les nouveaux événements sont abandonnés plutôt que
+    de bloquer la vérification.
+    """
+    global _writer
+    with _lock:
+        shutdown_audit_log()
+
+        if when:
+            handler = logging.handlers.TimedRotatingFileHandler(
+                path, when=when, backupCount=backup_count, encoding="utf-8"
+            )
+        else:
+            handler = logging.handlers.RotatingFileHandler(
+                path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8",
+            )
+        handler.setFormatter(JsonFormatter())
+
+        records = queue.Queue(maxsize=max_queue)
+        _writer = BatchWriter(records, handler, batch_size, flush_interval)
+
+        logger = logging.getLogger(AUDIT_LOGGER)
+        logger.handlers[:] = [_LazyQueueHandler(records)]
+        logger.setLevel(level)
+        logger.propagate = False
+        return logger
+
+
+def shutdown_audit_log():
+    """Écrit les événements en attente et arrête le thread d'écriture."""
+    global _writer
+    with _lock:
+        if _writer is not None:
+            logging.getLogger(AUDIT_LOGGER).handlers[:] = []
+            _writer.stop()
+            _writer = None
+
+
+atexit.register(shutdown_audit_log)
+
+
+def get_audit_logger():
+    """Logger d'audit, configuré avec les valeurs par défaut au premier appel."""
+    if _writer is None:
+        with _lock:
+            if _writer is None:
+                return setup_audit_log()
+    return logging.getLogger(AUDIT_LOGGER)
+
+
+def audit_event(logger, level, event, **fields):
+    """
+    Émet un événement structuré. Si le niveau est désactivé, rien n'est
+    construit ni mis en file.
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": fields})
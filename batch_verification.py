@@ -0,0 +1,152 @@
+# batch_verification.py
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from verification import is_error_message, verify_signature
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+
+# -------- Préparation des paires --------
+
+def list_images(folder):
+    """Images d'un dossier, triées par nom."""
+    return [
+        os.path.join(folder, name)
+        for name in sorted(os.listdir(folder))
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    ]
+
+
+def build_pairs(source, reference=None):
+    """
+    source : liste de paires (entrée, référence) ou dossier d'images.
+    Pour un dossier, toutes les images sont comparées à `reference`.
+    """
+    if isinstance(source, str):
+        if reference is None:
+            raise ValueError("Une référence est nécessaire pour vérifier un dossier.")
+        return [(path, reference) for path in list_images(source)]
+    return [tuple(pair) for pair in source]
+
+
+def read_pairs_file(path):
+    """Fichier CSV à deux colonnes : image_entree,image_reference."""
+    with open(path, newline="", encoding="utf-8") as f:
+        return [(row[0], row[1]) for row in csv.reader(f) if len(row) >= 2]
+
+
+# -------- Travail d'un processus --------
+
+def _init_worker(references):
+    # Chaque processus prétraite les références une seule fois. Un échec
+    # ici ne doit pas casser le pool : le cache se remplira à la demande et
+    # _verify_one rapportera l'erreur sur chaque ligne concernée.
+    from reference_cache import warm_up
+    try:
+        warm_up(references)
+    except Exception as e:
+        print(f"Erreur : préchargement des références impossible ({e})", file=sys.stderr)
+
+
+def _verify_one(index, input_path, reference_path, threshold):
+    t0 = time.perf_counter()
+    try:
+        match, msg = verify_signature(input_path, reference_path, threshold)
+        # Échec rapporté par le vérificateur (image illisible, trop petite...)
+        error = msg if is_error_message(msg) else None
+    except Exception as e:
+        match, msg, error = False, "Erreur : vérification impossible.", str(e)
+    return {
+        "index": index,
+        "input": input_path,
+        "reference": reference_path,
+        "match": bool(match),
+        "message": msg,
+        "error": error,
+        "seconds": round(time.perf_counter() - t0, 6),
+    }
+
+
+# -------- API --------
+
+def verify_batch(source, reference=None, threshold=1000.0, workers=None, output=None):
+    """
+    Vérifie un lot de signatures sur un pool de processus.
+
+    source : liste de paires (entrée, référence) ou dossier d'images.
+    output : fichier (objet avec write) recevant une ligne JSON par résultat,
+             écrite dès que le résultat est prêt (ordre d'arrivée).
+    Retourne (résultats dans l'ordre des paires, statistiques).
+    """
+    pairs = build_pairs(source, reference)
+    results = [None] * len(pairs)
+    references = sorted({ref for _, ref in pairs})
+
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(references,),
+    ) as pool:
+        futures = [
+            pool.submit(_verify_one, i, inp, ref, threshold)
+            for i, (inp, ref) in enumerate(pairs)
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results[result["index"]] = result
+            if output is not None:
+                output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                output.flush()
+    elapsed = time.perf_counter() - t0
+
+    stats = {
+        "count": len(pairs),
+        "matches": sum(1 for r in results if r["match"]),
+        "errors": sum(1 for r in results if r["error"]),
+        "seconds": elapsed,
+        "per_second": len(pairs) / elapsed if elapsed > 0 else 0.0,
+    }
+    return results, stats
+
+
+# -------- Ligne de commande --------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vérification de signatures par lot")
+    parser.add_argument("source", help="dossier d'images ou fichier CSV de paires")
+    parser.add_argument("-r", "--reference", help="image de référence (mode dossier)")
+    parser.add_argument("-t", "--threshold", type=float, default=1000.0)
+    parser.add_argument("-w", "--workers", type=int, default=None)
+    parser.add_argument("-o", "--output", help="fichier JSONL (défaut : sortie standard)")
+    args = parser.parse_args(argv)
+
+    if os.path.isdir(args.source):
+        source = args.source
+    else:
+        source = read_pairs_file(args.source)
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        _, stats = verify_batch(source, args.reference, args.threshold, args.workers, out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(
+        f"{stats['count']} vérifications en {stats['seconds']:.2f} s "
+        f"({stats['per_second']:.1f} img/s), {stats['matches']} match(s), "
+        f"{stats['errors']} erreur(s)",
+        file=sys.stderr,
+    )
+    return 0 if stats["errors"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
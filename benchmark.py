@@ -0,0 +1,336 @@
+# benchmark.py
+"""
+Banc d'essai des étapes du pipeline et de la vérification complète, sur des
+signatures synthétiques (synthetic_signatures.py).
+
+    python benchmark.py -o bench.json            # mesure et enregistre
+    python benchmark.py --quick                  # petite grille
+    python benchmark.py --compare avant.json apres.json [--tolerance 0.2]
+    python benchmark.py --startup [--import-budget-ms 400]
+
+Le fichier JSON (une entrée par cas : nom, paramètres, médiane / p90 / min
+en ms) peut être comparé entre deux exécutions ; --compare termine avec un
+code 1 si un cas est plus lent que la tolérance.
+
+--startup mesure le temps d'import à froid (interpréteur neuf) des points
+d'entrée et termine avec un code 1 si l'un dépasse le budget, charge un
+backend lourd (cv2, PIL, scipy, skimage) dès l'import ou ne s'importe
+plus. Seul un point d'entrée dont une dépendance optionnelle extérieure
+manque (ex. tkinter) est ignoré.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from features import extract_features
+from preprocessing import (
+    PIPELINE_VERSION,
+    binarize_image,
+    compute_roi,
+    convert_to_grayscale,
+    remove_noise,
+    skeletonize_image,
+)
+from reference_db import ReferenceIndex, find_best_match
+from synthetic_signatures import ink_density, synthetic_gallery, synthetic_signature
+
+RESOLUTIONS = [(400, 200), (1200, 600), (2400, 1200)]
+# (nom, nombre de traits, épaisseur)
+DENSITIES = [("light", 2, 2), ("heavy", 5, 7)]
+GALLERY_SIZES = [100, 1000, 10000]
+
+QUICK_RESOLUTIONS = [(400, 200), (1200, 600)]
+QUICK_GALLERY_SIZES = [100, 1000]
+
+# Points d'entrée dont l'import doit rester léger (CLI, workers, interface)
+STARTUP_MODULES = ["verification", "enrollment", "reference_sync", "service",
+                   "page_detection", "signature_gui"]
+# Backends chargés seulement à la première étape qui en a besoin
+HEAVY_MODULES = ["cv2", "PIL", "scipy", "skimage"]
+# Médianes mesurées (interpréteur neuf, machine de développement chargée) :
+# numpy seul 100-140 ms ; verification 100-150 ; service 130-200 (numpy +
+# http.server ~35-55 ms, incompressibles) ; signature_gui 110-155 (tkinter).
+# Le budget laisse ~2x de marge sur ce bruit : il sert à repérer une dérive
+# (import lourd ajouté au niveau module) ; les backends lourds eux-mêmes
+# sont détectés exactement par HEAVY_MODULES.
+IMPORT_BUDGET_MS = 400.0
+
+
+# -------- Mesure --------
+
+def measure(fn, repeat=7, min_sample_s=0.005):
+    """
+    Temps (ms) par appel sur `repeat` échantillons : médiane, p90, min.
+    Comme timeit.autorange, chaque échantillon répète l'appel assez de fois
+    pour durer au moins `min_sample_s` (les cas très courts restent stables).
+    """
+    number = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - t0 >= min_sample_s or number >= 1 << 16:
+            break
+        number *= 2
+
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append(1000 * (time.perf_counter() - t0) / number)
+    samples = np.array(samples)
+    return {
+        "median_ms": float(np.median(samples)),
+        "p90_ms": float(np.percentile(samples, 90)),
+        "min_ms": float(samples.min()),
+        "runs": int(repeat),
+        "loops": int(number),
+    }
+
+
+def record(results, name, params, fn, repeat):
+    entry = {"name": name, "params": params}
+    entry.update(measure(fn, repeat))
+    results.append(entry)
+    print(f"  {name:18s} {json.dumps(params):52s} {entry['median_ms']:9.2f} ms")
+
+
+# -------- Cas --------
+
+def bench_stages(results, resolutions, repeat):
+    for w, h in resolutions:
+        for label, strokes, thickness in DENSITIES:
+            img = synthetic_signature(w, h, strokes, thickness, seed=w + strokes, noise=4)
+            params = {"width": w, "height": h, "ink": label,
+                      "ink_density": round(ink_density(img), 4)}
+
+            denoised = remove_noise(img)
+            gray = convert_to_grayscale(denoised)
+            binary = binarize_image(gray)
+            skeleton = skeletonize_image(binary)
+            roi, rw, rh = compute_roi(skeleton)
+
+            record(results, "remove_noise", params, lambda: remove_noise(img), repeat)
+            record(results, "binarize_image", params, lambda: binarize_image(gray), repeat)
+            record(results, "skeletonize_image", params,
+                   lambda: skeletonize_image(binary), repeat)
+            record(results, "compute_roi", params, lambda: compute_roi(skeleton), repeat)
+            record(results, "extract_features", params,
+                   lambda: extract_features(roi, rw, rh), repeat)
+
+
+def bench_matching(results, gallery_sizes, repeat):
+    probe = synthetic_signature(600, 250, 3, 3, seed=1)
+    _, probe01 = cv2.threshold(convert_to_grayscale(probe), 127, 1, cv2.THRESH_BINARY)
+    for size in gallery_sizes:
+        index = ReferenceIndex.from_references(synthetic_gallery(size))
+        params = {"gallery": size}
+        record(results, "find_best_match", params,
+               lambda: find_best_match(probe01, index), repeat)
+
+
+def bench_end_to_end(results, resolutions, repeat):
+    # Import ici : inutile de charger la vérification pour les autres cas
+    from verification import verify_signature
+
+    for w, h in resolutions:
+        ref = synthetic_signature(w, h, 3, 3, seed=10)
+        probe = synthetic_signature(w, h, 3, 3, seed=11, noise=4)
+        params = {"width": w, "height": h}
+        record(results, "verify_signature", params,
+               lambda: verify_signature(probe, ref), repeat)
+
+
+def run_benchmarks(quick=False, repeat=None):
+    resolutions = QUICK_RESOLUTIONS if quick else RESOLUTIONS
+    galleries = QUICK_GALLERY_SIZES if quick else GALLERY_SIZES
+    repeat = repeat or (3 if quick else 7)
+
+    results = []
+    print("Étapes :")
+    bench_stages(results, resolutions, repeat)
+    print("Recherche :")
+    bench_matching(results, galleries, repeat)
+    print("Vérification complète :")
+    bench_end_to_end(results, resolutions, repeat)
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "pipeline_version": PIPELINE_VERSION,
+            "quick": quick,
+        },
+        "results": results,
+    }
+
+
+# -------- Temps de démarrage --------
+
+_IMPORT_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+try:
+    import {module}
+except ModuleNotFoundError as e:
+    print(json.dumps({{"missing": e.name}}))
+    raise
+ms = 1000 * (time.perf_counter() - t0)
+print(json.dumps({{"ms": ms, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+_REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Dépendances extérieures facultatives : leur absence fait ignorer le point
+# d'entrée (toute autre erreur d'import est un échec du contrôle)
+OPTIONAL_DEPENDENCIES = ("tkinter", "_tkinter")
+
+
+class OptionalDependencyMissing(RuntimeError):
+    """Un point d'entrée dépend d'un module facultatif absent (ex. tkinter)."""
+
+
+def measure_import(module, repeat=5):
+    """
+    Temps d'import de `module` dans un interpréteur neuf (médiane et min en
+    ms sur `repeat` lancements) et backends lourds déjà chargés après l'import.
+    Lève OptionalDependencyMissing si une dépendance facultative manque,
+    RuntimeError pour tout autre échec d'import.
+    """
+    code = _IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)
+    samples, heavy = [], []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                             cwd=_REPO_DIR)
+        lines = out.stdout.strip().splitlines()
+        data = json.loads(lines[-1]) if lines else {}
+        if out.returncode != 0:
+            missing = data.get("missing")
+            if missing and missing.split(".")[0] in OPTIONAL_DEPENDENCIES:
+                raise OptionalDependencyMissing(
+                    f"{module} ignoré : dépendance optionnelle {missing} absente")
+            raise RuntimeError(f"Import de {module} impossible :\n{out.stderr.strip()}")
+        samples.append(data["ms"])
+        heavy = data["heavy"]
+    samples.sort()
+    return {"module": module, "median_ms": samples[len(samples) // 2],
+            "min_ms": samples[0], "heavy": heavy}
+
+
+def check_startup(modules=None, budget_ms=IMPORT_BUDGET_MS, repeat=5):
+    """
+    Mesures d'import et liste des modules en échec : hors budget, trop
+    lourds ou non importables (row["error"]).
+    """
+    rows, failures = [], []
+    for module in modules or STARTUP_MODULES:
+        try:
+            row = measure_import(module, repeat)
+        except OptionalDependencyMissing as e:
+            print(e, file=sys.stderr)
+            continue
+        except RuntimeError as e:
+            row = {"module": module, "median_ms": None, "min_ms": None, "heavy": [],
+                   "error": str(e)}
+            rows.append(row)
+            failures.append(row)
+            continue
+        rows.append(row)
+        if row["median_ms"] > budget_ms or row["heavy"]:
+            failures.append(row)
+    return rows, failures
+
+
+# -------- Comparaison de deux exécutions --------
+
+def case_key(entry):
+    return entry["name"], json.dumps(entry["params"], sort_keys=True)
+
+
+def compare_runs(before, after, tolerance=0.2, min_delta_ms=0.05):
+    """
+    Liste (nom, paramètres, médiane avant, médiane après, ratio) des cas
+    présents dans les deux fichiers, et liste des régressions : ratio au-delà
+    de la tolérance et écart absolu d'au moins `min_delta_ms`.
+    """
+    old = {case_key(e): e for e in before["results"]}
+    rows, regressions = [], []
+    for e in after["results"]:
+        prev = old.get(case_key(e))
+        if prev is None:
+            continue
+        ratio = e["median_ms"] / prev["median_ms"] if prev["median_ms"] > 0 else float("inf")
+        row = (e["name"], e["params"], prev["median_ms"], e["median_ms"], ratio)
+        rows.append(row)
+        if ratio > 1 + tolerance and e["median_ms"] - prev["median_ms"] >= min_delta_ms:
+            regressions.append(row)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banc d'essai du pipeline de signatures")
+    parser.add_argument("-o", "--output", help="fichier JSON de résultats")
+    parser.add_argument("--quick", action="store_true", help="grille réduite")
+    parser.add_argument("--repeat", type=int, help="répétitions par cas")
+    parser.add_argument("--compare", nargs=2, metavar=("AVANT", "APRES"))
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="ralentissement toléré avec --compare (0.2 = +20 %%)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05,
+                        help="écart absolu minimal pour compter une régression")
+    parser.add_argument("--startup", action="store_true",
+                        help="vérifie le temps d'import à froid des points d'entrée")
+    parser.add_argument("--import-budget-ms", type=float, default=IMPORT_BUDGET_MS,
+                        help="budget d'import par module avec --startup")
+    parser.add_argument("--modules", nargs="+", help="modules à mesurer avec --startup")
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        rows, failures = check_startup(args.modules, args.import_budget_ms,
+                                       args.repeat or 5)
+        for row in rows:
+            if row.get("error"):
+                print(f"{row['module']:16s}   import impossible  <-- échec\n{row['error']}")
+                continue
+            flag = "  <-- hors budget" if row in failures else ""
+            heavy = f"  charge {', '.join(row['heavy'])}" if row["heavy"] else ""
+            print(f"{row['module']:16s} {row['median_ms']:8.1f} ms "
+                  f"(min {row['min_ms']:.1f}){heavy}{flag}")
+        print(f"\n{len(failures)} module(s) en échec ({args.import_budget_ms:.0f} ms, "
+              f"sans {', '.join(HEAVY_MODULES)}) sur {len(rows)}.")
+        return 1 if failures else 0
+
+    if args.compare:
+        with open(args.compare[0], encoding="utf-8") as f:
+            before = json.load(f)
+        with open(args.compare[1], encoding="utf-8") as f:
+            after = json.load(f)
+        rows, regressions = compare_runs(before, after, args.tolerance, args.min_delta_ms)
+        for row in rows:
+            name, params, a, b, ratio = row
+            flag = "  <-- régression" if row in regressions else ""
+            print(f"{name:18s} {json.dumps(params):52s} {a:9.2f} -> {b:9.2f} ms "
+                  f"(x{ratio:.2f}){flag}")
+        print(f"\n{len(regressions)} régression(s) sur {len(rows)} cas comparés.")
+        return 1 if regressions else 0
+
+    report = run_benchmarks(args.quick, args.repeat)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nRésultats enregistrés dans {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,8 +2,6 @@
 
 from PIL import Image, ImageFilter
 import numpy as np
-from scipy import ndimage
-from skimage.morphology import skeletonize
 
 def process_image(image_path):
     
@@ -91,6 +89,9 @@ def binarization(image):
 
 def skeletonization(image):
     """Apply skeletonization to binary image"""
+    # Lazy import: skimage takes ~0.5 s to load and is only needed here
+    from skimage.morphology import skeletonize
+
     # Convert to numpy array
     img_array = np.array(image)
     
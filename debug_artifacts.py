@@ -0,0 +1,103 @@
+# debug_artifacts.py
+import itertools
+import os
+import queue
+import sys
+import threading
+import time
+
+# Dossier par défaut ; SIGNATURE_DEBUG_DIR active le mode debug au démarrage
+DEBUG_DIR = "debug"
+
+
+class DebugArtifactSink:
+    """
+    Écrit les images intermédiaires du pipeline dans un sous-dossier par
+    requête, depuis un thread dédié. La file est bornée : si elle est pleine,
+    les images sont abandonnées (compteur `dropped`) plutôt que de bloquer
+    la vérification.
+    """
+
+    def __init__(self, root=DEBUG_DIR, max_queue=32):
+        self.root = root
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._ids = itertools.count()
+        self._thread = threading.Thread(
+            target=self._run, name="debug-artifacts", daemon=True
+        )
+        self._thread.start()
+
+    def new_request_id(self, label="req"):
+        stamp = time.strftime("%Y%m%d_%H%M%S")
+        return f"{stamp}_{os.getpid()}_{next(self._ids):06d}_{label}"
+
+    def submit(self, images, label="req"):
+        """
+        images : liste de (nom_fichier, tableau NumPy).
+        Retourne le dossier de la requête, ou None si la file est pleine.
+        """
+        request_dir = os.path.join(self.root, self.new_request_id(label))
+        try:
+            self._queue.put_nowait((request_dir, images))
+        except queue.Full:
+            self.dropped += 1
+            return None
+        return request_dir
+
+    def _run(self):
+        from PIL import Image  # chargé par le thread d'écriture, pas à l'import
+
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                request_dir, images = item
+                os.makedirs(request_dir, exist_ok=True)
+                for filename, image in images:
+                    if image is None:
+                        continue
+                    Image.fromarray(image).save(os.path.join(request_dir, filename))
+                    self.written += 1
+            except Exception as e:
+                print("Erreur écriture debug :", e, file=sys.stderr)
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Attend que toutes les images en file soient écrites."""
+        self._queue.join()
+
+    def close(self):
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+
+
+_sink = None
+
+
+def enable_debug_artifacts(root=DEBUG_DIR, max_queue=32):
+    """Active l'écriture des images de debug (désactivée par défaut)."""
+    global _sink
+    disable_debug_artifacts()
+    _sink = DebugArtifactSink(root, max_queue)
+    return _sink
+
+
+def disable_debug_artifacts():
+    global _sink
+    if _sink is not None:
+        _sink.close()
+        _sink = None
+
+
+def get_sink():
+    """Sink actif, ou None si le mode debug est désactivé."""
+    return _sink
+
+
+if os.environ.get("SIGNATURE_DEBUG_DIR"):
+    enable_debug_artifacts(os.environ["SIGNATURE_DEBUG_DIR"])
@@ -0,0 +1,147 @@
+# enrollment.py
+"""
+Enrôlement de plusieurs personnes et identification 1:N.
+
+Les échantillons sont rangés par propriétaire :
+
+    enrolled/
+        Selsabil/  Selsabil_20260108_145551_0.png  ...
+        Amine/     Amine_20260109_101200_0.png     ...
+
+- vérification 1:1 : verify_owner(image, "Amine") compare l'image aux
+  seuls échantillons d'Amine ;
+- identification 1:N : identify(image) classe les propriétaires du plus
+  proche au plus lointain. Un préfiltre par cases de taille
+  (reference_db.SizePrefilter) élague la galerie avant le calcul des
+  distances.
+
+Les features de la galerie sont celles de verify_signature (ROI
+squelettisée, via le cache des références) : les deux modes donnent la même
+distance pour une même paire d'images.
+"""
+import os
+import re
+import sys
+import time
+
+from features import extract_features
+from preprocessing import load_image, preprocess_signature, save_processed_image
+from reference_cache import get_reference
+from reference_db import IMAGE_EXTENSIONS, ReferenceIndex, identify as identify_features
+from verification import DEFAULT_OWNER, verify_signature
+
+ENROLL_FOLDER = "enrolled"
+
+# Nom de propriétaire = nom de dossier : lettres, chiffres, "_", "-" et espaces
+# uniquement (ni séparateur de chemin ni "..", pas de sortie de `folder`)
+OWNER_PATTERN = re.compile(r"[\w\- ]+")
+
+
+def check_owner(owner):
+    """Retourne `owner` s'il est valide, lève ValueError sinon."""
+    if not isinstance(owner, str) or not OWNER_PATTERN.fullmatch(owner) or not owner.strip():
+        raise ValueError(f"Nom de propriétaire invalide : {owner!r}")
+    return owner
+
+
+def enroll(owner, samples, folder=ENROLL_FOLDER):
+    """
+    Enregistre des échantillons (chemins, octets ou tableaux NumPy) pour
+    `owner`. Retourne les chemins des fichiers créés.
+    Lève ValueError si `owner` n'est pas un nom valide (voir check_owner).
+    """
+    owner_dir = os.path.join(folder, check_owner(owner))
+    os.makedirs(owner_dir, exist_ok=True)
+    stamp = time.strftime("%Y%m%d_%H%M%S")
+    paths = []
+    for i, sample in enumerate(samples):
+        img = load_image(sample)
+        if img is None:
+            print(f"Erreur : échantillon illisible ignoré ({owner}, n°{i})", file=sys.stderr)
+            continue
+        path = os.path.join(owner_dir, f"{owner}_{stamp}_{i}.png")
+        if img.ndim == 3:
+            img = img[:, :, ::-1]  # BGR -> RGB pour PIL
+        save_processed_image(img, path)
+        paths.append(path)
+    return paths
+
+
+def list_owners(folder=ENROLL_FOLDER):
+    if not os.path.isdir(folder):
+        return []
+    return sorted(
+        name for name in os.listdir(folder)
+        if os.path.isdir(os.path.join(folder, name)) and OWNER_PATTERN.fullmatch(name)
+    )
+
+
+def enrolled_samples(owner, folder=ENROLL_FOLDER):
+    """
+    Chemins des échantillons d'un propriétaire (liste vide si inconnu).
+    Lève ValueError si `owner` n'est pas un nom valide (voir check_owner).
+    """
+    owner_dir = os.path.join(folder, check_owner(owner))
+    if not os.path.isdir(owner_dir):
+        return []
+    return [
+        os.path.join(owner_dir, name) for name in sorted(os.listdir(owner_dir))
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    ]
+
+
+def load_gallery(folder=ENROLL_FOLDER, **index_kwargs):
+    """
+    Index de tous les échantillons enrôlés ; chaque entrée porte son
+    propriétaire ("owner"). Les échantillons illisibles sont ignorés.
+    """
+    entries = []
+    for owner in list_owners(folder):
+        for path in enrolled_samples(owner, folder):
+            roi, w, h, features = get_reference(path)
+            if roi is None:
+                continue
+            entries.append({
+                "name": f"{owner}/{os.path.basename(path)}",
+                "owner": owner,
+                "path": path,
+                "features": features,
+            })
+    return ReferenceIndex.from_references(entries, **index_kwargs)
+
+
+def verify_owner(image, owner=DEFAULT_OWNER, threshold=1000.0, folder=ENROLL_FOLDER):
+    """Vérification 1:1 contre tous les échantillons de `owner`."""
+    samples = enrolled_samples(owner, folder)
+    if not samples:
+        return False, f"Erreur : aucun échantillon enrôlé pour {owner}."
+    return verify_signature(image, samples, threshold, owner=owner)
+
+
+def identify(image, gallery=None, k=3, threshold=1000.0, prefilter=True):
+    """
+    Identification 1:N : [{"owner", "distance", "match", "entry"}], du plus
+    proche au plus lointain (au plus `k` propriétaires).
+    gallery : index déjà chargé (load_gallery) ; rechargé sinon.
+    """
+    roi, w, h = preprocess_signature(image)
+    if roi is None:
+        return []
+    if gallery is None:
+        gallery = load_gallery()
+    features = extract_features(roi, w, h)
+    return identify_features(features, gallery, k=k, threshold=threshold, prefilter=prefilter)
+
+
+# --- TEST ---
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 2 and sys.argv[1] == "enroll":
+        owner = sys.argv[2]
+        print(f"{len(enroll(owner, sys.argv[3:]))} échantillon(s) enrôlé(s) pour {owner}")
+    else:
+        image = sys.argv[1] if len(sys.argv) > 1 else "image_test.png"
+        for rank, result in enumerate(identify(image), 1):
+            print(f"{rank}. {result['owner']:20s} distance {result['distance']:9.2f}"
+                  f"  {'MATCH' if result['match'] else ''}")
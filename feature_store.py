@@ -0,0 +1,244 @@
+# feature_store.py
+"""
+Stockage compact d'une galerie de features, ouvert par memory-map.
+
+Un magasin est un dossier contenant :
+- features.f32  : matrice float32 brute (count x dim), lignes bout à bout ;
+- entries.jsonl : une ligne JSON par référence (nom, empreinte, métadonnées) ;
+- header.json   : {"version", "dim", "count", "entries_bytes", "feature_keys",
+                   "matrix_file", "entries_file"} ; les deux derniers nomment
+                   les fichiers de données (défaut : features.f32 / entries.jsonl).
+
+Ouverture : lecture de l'en-tête + np.memmap en lecture seule ; aucune image
+n'est relue et les pages du fichier sont partagées par tous les processus
+qui ouvrent le même magasin (cache du système).
+
+Ajout : les lignes sont écrites à la fin des deux fichiers de données, puis
+l'en-tête est remplacé atomiquement avec le nouveau `count`. Un lecteur ne
+voit donc que des lignes complètes, même pendant un ajout. Un seul écrivain
+à la fois par magasin (reference_sync en est le seul) : les lecteurs peuvent
+être aussi nombreux que l'on veut.
+
+Réécriture complète (write) d'un magasin existant : les données sont
+écrites dans de nouveaux fichiers du même dossier, puis l'en-tête remplacé
+pointe vers eux. Le dossier ne disparaît jamais ; un lecteur voit l'ancienne
+ou la nouvelle galerie, jamais un mélange.
+"""
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+
+STORE_VERSION = 1
+HEADER = "header.json"
+MATRIX = "features.f32"
+ENTRIES = "entries.jsonl"
+
+
+def _write_json_atomic(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class StoreEntries:
+    """
+    Séquence des entrées, décodées à la demande : l'ouverture ne fait que
+    découper le fichier en lignes, pas de json.loads sur toute la galerie.
+    Chaque entrée reçoit aussi son dictionnaire "features" (lu dans la matrice).
+    """
+
+    def __init__(self, lines, matrix, feature_keys):
+        self._lines = lines
+        self._matrix = matrix
+        self._keys = feature_keys
+
+    def __len__(self):
+        return len(self._lines)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        entry = json.loads(self._lines[i])
+        row = self._matrix[i]
+        entry["features"] = {k: float(v) for k, v in zip(self._keys, row)}
+        return entry
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class FeatureStore:
+    def __init__(self, path):
+        """Ouvre un magasin existant (lecture seule, memory-map)."""
+        self.path = path
+        self.reload()
+
+    # ---------- Création / ouverture ----------
+
+    @classmethod
+    def create(cls, path, feature_keys):
+        """Crée un magasin vide (écrase un magasin existant)."""
+        os.makedirs(path, exist_ok=True)
+        for name in (MATRIX, ENTRIES):
+            open(os.path.join(path, name), "wb").close()
+        _write_json_atomic(os.path.join(path, HEADER), {
+            "version": STORE_VERSION,
+            "dim": len(feature_keys),
+            "count": 0,
+            "entries_bytes": 0,
+            "feature_keys": list(feature_keys),
+        })
+        return cls(path)
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, HEADER))
+
+    def reload(self):
+        """Relit l'en-tête : prend en compte les ajouts d'autres processus."""
+        with open(os.path.join(self.path, HEADER), encoding="utf-8") as f:
+            header = json.load(f)
+        if header.get("version") != STORE_VERSION:
+            raise ValueError(f"Version de magasin non supportée : {header.get('version')}")
+        self.feature_keys = tuple(header["feature_keys"])
+        self.dim = int(header["dim"])
+        self.count = int(header["count"])
+        self.entries_bytes = int(header["entries_bytes"])
+        self.matrix_file = header.get("matrix_file", MATRIX)
+        self.entries_file = header.get("entries_file", ENTRIES)
+
+        if self.count:
+            self.matrix = np.memmap(
+                os.path.join(self.path, self.matrix_file), dtype=np.float32, mode="r",
+                shape=(self.count, self.dim),
+            )
+            with open(os.path.join(self.path, self.entries_file), "rb") as f:
+                lines = f.read(self.entries_bytes).split(b"\n")[:self.count]
+        else:
+            self.matrix = np.empty((0, self.dim), dtype=np.float32)
+            lines = []
+        self.entries = StoreEntries(lines, self.matrix, self.feature_keys)
+
+    def __len__(self):
+        return self.count
+
+    # ---------- Écriture ----------
+
+    def append(self, entries, vectors):
+        """
+        Ajoute des références sans réécrire l'existant.
+        entries : dictionnaires JSON (sans "features") ; vectors : (n, dim).
+        Un seul écrivain à la fois : l'en-tête est relu avant l'ajout (une
+        instance ouverte avant l'ajout d'un autre processus ne l'efface
+        donc pas), mais deux ajouts simultanés ne sont pas coordonnés.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        entries = list(entries)
+        if len(entries) != len(vectors):
+            raise ValueError("Autant d'entrées que de vecteurs attendues.")
+        if not entries:
+            return
+
+        # En-tête à jour : seul ce qui dépasse le `count` publié est tronqué
+        # (reste d'un ajout interrompu), jamais les lignes d'un autre écrivain
+        self.reload()
+        matrix_path = os.path.join(self.path, self.matrix_file)
+        with open(matrix_path, "r+b") as f:
+            f.truncate(self.count * self.dim * 4)
+            f.seek(0, os.SEEK_END)
+            f.write(vectors.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        lines = b"".join(
+            json.dumps({k: v for k, v in e.items() if k != "features"},
+                       ensure_ascii=False).encode("utf-8") + b"\n"
+            for e in entries
+        )
+        with open(os.path.join(self.path, self.entries_file), "r+b") as f:
+            f.truncate(self.entries_bytes)
+            f.seek(self.entries_bytes)
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+        _write_json_atomic(os.path.join(self.path, HEADER), {
+            "version": STORE_VERSION,
+            "dim": self.dim,
+            "count": self.count + len(entries),
+            "entries_bytes": self.entries_bytes + len(lines),
+            "feature_keys": list(self.feature_keys),
+            "matrix_file": self.matrix_file,
+            "entries_file": self.entries_file,
+        })
+        self.reload()
+
+    @classmethod
+    def write(cls, path, feature_keys, entries, vectors):
+        """Écrit un magasin complet (compaction après suppressions)."""
+        # Restes d'une écriture interrompue (dont l'ancien échange par ".old")
+        for stale in (path + ".tmp", path + ".old"):
+            if os.path.isdir(stale):
+                shutil.rmtree(stale)
+
+        if not cls.exists(path):
+            # Nouveau magasin préparé à côté puis renommé d'un bloc
+            tmp = path + ".tmp"
+            cls.create(tmp, feature_keys).append(entries, vectors)
+            if os.path.isdir(path) and not os.listdir(path):
+                os.rmdir(path)
+            if not os.path.exists(path):
+                os.replace(tmp, path)
+                return cls(path)
+            shutil.rmtree(tmp)  # dossier non vide sans en-tête : écrit sur place
+            cls.create(path, feature_keys).append(entries, vectors)
+            return cls(path)
+
+        # Magasin existant : nouvelle génération de fichiers, publiée par le
+        # remplacement atomique de l'en-tête ; l'ancienne est supprimée ensuite
+        previous = cls(path)
+        old_files = (previous.matrix_file, previous.entries_file)
+        del previous  # libère le memmap avant la suppression des fichiers
+        generation = uuid.uuid4().hex[:12]
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, len(feature_keys))
+        entries = list(entries)
+        if len(entries) != len(vectors):
+            raise ValueError("Autant d'entrées que de vecteurs attendues.")
+        lines = b"".join(
+            json.dumps({k: v for k, v in e.items() if k != "features"},
+                       ensure_ascii=False).encode("utf-8") + b"\n"
+            for e in entries
+        )
+        matrix_file = f"features.{generation}.f32"
+        entries_file = f"entries.{generation}.jsonl"
+        for name, data in ((matrix_file, vectors.tobytes()), (entries_file, lines)):
+            with open(os.path.join(path, name), "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        _write_json_atomic(os.path.join(path, HEADER), {
+            "version": STORE_VERSION,
+            "dim": len(feature_keys),
+            "count": len(vectors),
+            "entries_bytes": len(lines),
+            "feature_keys": list(feature_keys),
+            "matrix_file": matrix_file,
+            "entries_file": entries_file,
+        })
+        # Un lecteur qui a déjà ouvert l'ancienne génération garde ses pages
+        # (memmap) ; les suivants lisent la nouvelle
+        for name in old_files:
+            if name in (matrix_file, entries_file):
+                continue
+            try:
+                os.remove(os.path.join(path, name))
+            except OSError:
+                pass
+        return cls(path)
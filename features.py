@@ -1,3 +1,5 @@
+import time
+
 import numpy as np
 
 
@@ -24,6 +26,39 @@ def extract_features(roi, width: int, height: int):
     }
 
 
+# Contrat commun aux deux backends du pipeline (voir pipeline.py)
+SHAPE_FEATURE_KEYS = (
+    "width", "height", "black_pixels", "ink_pixels", "aspect_ratio", "density",
+)
+
+
+def extract_shape_features(roi, binary_roi=None):
+    """
+    Features communes calculées sur la ROI (0 = noir, 255 = blanc) :
+    - width, height, black_pixels : comme extract_features (squelette)
+    - ink_pixels : pixels noirs de l'image binaire dans la même boîte
+    - aspect_ratio = width / height, density = ink_pixels / (width * height)
+    """
+    if roi is None:
+        return {k: 0 for k in SHAPE_FEATURE_KEYS}
+
+    h, w = roi.shape[:2]
+    black_pixels = int(np.count_nonzero(roi == 0))
+    if binary_roi is None:
+        ink_pixels = black_pixels
+    else:
+        ink_pixels = int(np.count_nonzero(binary_roi == 0))
+
+    return {
+        "width": int(w),
+        "height": int(h),
+        "black_pixels": black_pixels,
+        "ink_pixels": ink_pixels,
+        "aspect_ratio": w / h if h > 0 else 0.0,
+        "density": ink_pixels / (w * h) if w * h > 0 else 0.0,
+    }
+
+
 def extract_basic_features(image):
     """
     Version simplifiée pour des images binaires complètes (0 = noir, 1 ou 255 = blanc).
@@ -47,8 +82,121 @@ def extract_basic_features(image):
     }
 
 
-def extract_advanced_features(image):
+# -------- Features avancées : vecteur float32 de taille fixe --------
+
+GRID_ROWS, GRID_COLS = 4, 8
+PROJECTION_BINS = 16
+# Orientations des paires de pixels noirs voisins : 0°, 45°, 90°, 135°
+ORIENTATIONS = (0, 45, 90, 135)
+
+ADVANCED_FEATURE_NAMES = (
+    [f"grid_{r}_{c}" for r in range(GRID_ROWS) for c in range(GRID_COLS)]
+    + [f"proj_h_{i}" for i in range(PROJECTION_BINS)]
+    + [f"proj_v_{i}" for i in range(PROJECTION_BINS)]
+    + ["endpoints", "junctions"]
+    + [f"orient_{a}" for a in ORIENTATIONS]
+)
+ADVANCED_FEATURE_SIZE = len(ADVANCED_FEATURE_NAMES)
+
+# Voisins P2..P9 (sens horaire depuis le nord) -> bit 0..7 du code de voisinage
+_NEIGHBOUR_BITS = ((0, 1), (0, 2), (1, 2), (2, 2), (2, 1), (2, 0), (1, 0), (0, 0))
+# Nombre de transitions blanc -> noir autour du pixel pour chaque code :
+# 1 = extrémité du trait, >= 3 = jonction (nombre de croisements)
+_CROSSINGS = np.array(
+    [sum(1 for i in range(8) if not (c >> i) & 1 and (c >> ((i + 1) % 8)) & 1)
+     for c in range(256)],
+    dtype=np.uint8,
+)
+
+
+def _bin_sums(cumsum, n_bins):
+    """Somme par intervalle régulier à partir d'une somme cumulée (0 en tête)."""
+    edges = np.linspace(0, len(cumsum) - 1, n_bins + 1).round().astype(int)
+    return cumsum[edges[1:]] - cumsum[edges[:-1]], np.diff(edges)
+
+
+def extract_advanced_features(image, timings=None):
     """
-    Placeholder pour features avancées (tu peux compléter plus tard).
+    Descripteur de taille fixe (ADVANCED_FEATURE_SIZE, float32, ordre
+    ADVANCED_FEATURE_NAMES) calculé sur la ROI (0 = noir) :
+    - densité d'encre de chaque case d'une grille GRID_ROWS x GRID_COLS ;
+    - projections horizontale et verticale (PROJECTION_BINS cases chacune,
+      normalisées par l'encre totale) ;
+    - nombre d'extrémités et de jonctions du trait (nombre de croisements
+      autour du pixel : 1 et >= 3) ;
+    - histogramme normalisé des orientations des paires de pixels voisins.
+    Le masque d'encre est calculé une fois et réutilisé par tous les blocs.
+    timings : dictionnaire optionnel rempli avec la durée (ms) de chaque bloc.
     """
-    return {}
+    out = np.zeros(ADVANCED_FEATURE_SIZE, dtype=np.float32)
+    if image is None:
+        return out
+    arr = np.asarray(image)
+    if arr.ndim == 3:
+        arr = arr[:, :, 0]
+    if arr.size == 0:
+        return out
+
+    clock = time.perf_counter if timings is not None else None
+    t = clock() if clock else 0.0
+
+    def lap(name):
+        nonlocal t
+        if clock:
+            now = clock()
+            timings[name] = 1000 * (now - t)
+            t = now
+
+    ink = (arr == 0).astype(np.int32)
+    h, w = ink.shape
+    total = ink.sum()
+    pos = 0
+
+    # Grille : image intégrale puis 4 lectures par case
+    integral = np.zeros((h + 1, w + 1), dtype=np.int64)
+    np.cumsum(np.cumsum(ink, axis=0), axis=1, out=integral[1:, 1:])
+    ys = np.linspace(0, h, GRID_ROWS + 1).round().astype(int)
+    xs = np.linspace(0, w, GRID_COLS + 1).round().astype(int)
+    cells = (integral[np.ix_(ys[1:], xs[1:])] - integral[np.ix_(ys[:-1], xs[1:])]
+             - integral[np.ix_(ys[1:], xs[:-1])] + integral[np.ix_(ys[:-1], xs[:-1])])
+    area = np.outer(np.diff(ys), np.diff(xs))
+    grid = np.divide(cells, area, out=np.zeros(cells.shape), where=area > 0)
+    out[pos:pos + grid.size] = grid.ravel()
+    pos += grid.size
+    lap("grid")
+
+    # Projections : sommes par ligne / colonne regroupées en cases
+    rows = np.concatenate(([0], np.cumsum(integral[1:, w] - integral[:-1, w])))
+    cols = np.concatenate(([0], np.cumsum(integral[h, 1:] - integral[h, :-1])))
+    for cumsum in (rows, cols):
+        sums, _ = _bin_sums(cumsum, PROJECTION_BINS)
+        if total:
+            out[pos:pos + PROJECTION_BINS] = sums / total
+        pos += PROJECTION_BINS
+    lap("projections")
+
+    # Extrémités / jonctions : code de voisinage 3x3 (somme pondérée des 8
+    # voisins, une convolution) puis nombre de croisements par table
+    padded = np.pad(ink, 1)
+    code = np.zeros((h, w), dtype=np.int32)
+    for bit, (dy, dx) in enumerate(_NEIGHBOUR_BITS):
+        code += padded[dy:dy + h, dx:dx + w] << bit
+    crossings = _CROSSINGS[code[ink == 1]]
+    out[pos] = np.count_nonzero(crossings == 1)
+    out[pos + 1] = np.count_nonzero(crossings >= 3)
+    pos += 2
+    lap("topology")
+
+    # Orientations : paires noir-noir horizontales, diagonales, verticales
+    centre = padded[1:-1, 1:-1]
+    pairs = np.array([
+        np.count_nonzero(centre & padded[1:-1, 2:]),   # 0° (est)
+        np.count_nonzero(centre & padded[:-2, 2:]),    # 45° (nord-est)
+        np.count_nonzero(centre & padded[:-2, 1:-1]),  # 90° (nord)
+        np.count_nonzero(centre & padded[:-2, :-2]),   # 135° (nord-ouest)
+    ], dtype=np.float64)
+    if pairs.sum():
+        out[pos:pos + len(ORIENTATIONS)] = pairs / pairs.sum()
+    lap("orientation")
+
+    return out
@@ -0,0 +1,90 @@
+# gui_worker.py
+"""
+Exécution des traitements lourds de l'interface hors du thread Tk.
+
+Les tâches tournent dans un thread de travail ; leurs résultats sont déposés
+dans une file que le thread Tk relève via root.after (Tk ne doit être
+manipulé que depuis son propre thread).
+
+Chaque demande « remplaçable » (coalesce=True) reçoit un numéro de
+génération. Une nouvelle demande, ou invalidate() quand l'utilisateur
+redessine, annule celles encore en attente et rend obsolètes celles déjà
+en cours : leur résultat est ignoré à l'arrivée. Un double clic ne fait
+donc jamais attendre deux vérifications, et on n'affiche jamais le
+résultat d'un dessin effacé.
+"""
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BackgroundWorker:
+    def __init__(self, root, poll_ms=30, workers=1):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix="signature-worker")
+        self.results = queue.Queue()
+        self.generation = 0
+        self._outstanding = set()  # tâches dont le résultat n'est pas encore relevé
+        self._replaceable = set()  # sous-ensemble annulable par une nouvelle demande
+        self._polling = False
+
+    def submit(self, fn, *args, on_done=None, on_error=None, coalesce=True):
+        """
+        Lance fn(*args) en arrière-plan. on_done(résultat) ou on_error(exception)
+        sont appelés dans le thread Tk, sauf si la demande est devenue obsolète.
+        coalesce=False : tâche de fond (préchauffage...) jamais annulée.
+        """
+        if coalesce:
+            self.invalidate()
+        generation = self.generation
+        future = self.executor.submit(fn, *args)
+        self._outstanding.add(future)
+        if coalesce:
+            self._replaceable.add(future)
+        future.add_done_callback(
+            lambda f: self.results.put((f, generation, coalesce, on_done, on_error))
+        )
+        self._schedule_poll()
+        return future
+
+    def invalidate(self):
+        """Rend obsolètes toutes les demandes remplaçables en cours."""
+        self.generation += 1
+        for future in self._replaceable:
+            future.cancel()  # sans effet sur une tâche déjà démarrée
+        self._replaceable.clear()
+
+    @property
+    def busy(self):
+        return any(not f.done() for f in self._replaceable)
+
+    def _schedule_poll(self):
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_ms, self._poll)
+
+    def _poll(self):
+        while True:
+            try:
+                future, generation, coalesce, on_done, on_error = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self._outstanding.discard(future)
+            self._replaceable.discard(future)
+            if future.cancelled() or (coalesce and generation != self.generation):
+                continue
+            error = future.exception()
+            if error is not None:
+                if on_error is not None:
+                    on_error(error)
+            elif on_done is not None:
+                on_done(future.result())
+
+        self._polling = False
+        if self._outstanding:
+            self._schedule_poll()
+
+    def shutdown(self):
+        self.invalidate()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,153 @@
+# metrics.py
+"""
+Instrumentation optionnelle du chemin de vérification : histogrammes de
+latence par étape et compteurs, exportables en dictionnaire ou au format
+texte Prometheus.
+
+Désactivée par défaut (ou via SIGNATURE_METRICS=1) : dans ce cas
+`metrics.stage(...)` renvoie un contexte vide partagé et `metrics.inc(...)`
+ne fait rien, le surcoût est négligeable.
+
+    from metrics import metrics
+    with metrics.stage("denoise"):
+        ...
+    metrics.inc("matches")
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+# Bornes des histogrammes de latence (ms)
+DEFAULT_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_NULL = nullcontext()
+
+
+class Histogram:
+    """Histogramme cumulable à bornes fixes (style Prometheus)."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # dernière case = +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """[(borne, nombre d'observations <= borne)], +Inf compris."""
+        out, total = [], 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            total += n
+            out.append((bound, total))
+        return out
+
+
+class _StageTimer:
+    __slots__ = ("metrics", "name", "t0")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, 1000 * (time.perf_counter() - self.t0))
+        return False
+
+
+class Metrics:
+    def __init__(self, enabled=False, buckets=DEFAULT_BUCKETS_MS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    # ---------- Enregistrement ----------
+
+    def stage(self, name):
+        """Contexte qui mesure la durée d'une étape (no-op si désactivé)."""
+        if not self.enabled:
+            return _NULL
+        return _StageTimer(self, name)
+
+    def observe(self, name, ms):
+        if not self.enabled:
+            return
+        with self._lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = Histogram(self.buckets)
+            hist.observe(ms)
+
+    def inc(self, name, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    # ---------- Export ----------
+
+    def snapshot(self):
+        """État courant sous forme de dictionnaire (sérialisable en JSON)."""
+        with self._lock:
+            stages = {}
+            for name, h in self.histograms.items():
+                stages[name] = {
+                    "count": h.count,
+                    "sum_ms": h.sum,
+                    "mean_ms": h.sum / h.count if h.count else 0.0,
+                    "buckets": {
+                        ("+Inf" if b == float("inf") else str(b)): n
+                        for b, n in h.cumulative()
+                    },
+                }
+            return {"counters": dict(self.counters), "stages": stages}
+
+    def to_prometheus(self, prefix="signature"):
+        """Format texte d'exposition Prometheus."""
+        lines = []
+        with self._lock:
+            for name in sorted(self.counters):
+                metric = f"{prefix}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {self.counters[name]}")
+
+            metric = f"{prefix}_stage_latency_ms"
+            if self.histograms:
+                lines.append(f"# TYPE {metric} histogram")
+            for name in sorted(self.histograms):
+                h = self.histograms[name]
+                for bound, n in h.cumulative():
+                    le = "+Inf" if bound == float("inf") else repr(float(bound))
+                    lines.append(f'{metric}_bucket{{stage="{name}",le="{le}"}} {n}')
+                lines.append(f'{metric}_sum{{stage="{name}"}} {h.sum}')
+                lines.append(f'{metric}_count{{stage="{name}"}} {h.count}')
+        return "\n".join(lines) + "\n"
+
+
+# Instance partagée par preprocessing.py et verification.py
+metrics = Metrics(enabled=os.environ.get("SIGNATURE_METRICS", "") not in ("", "0"))
+
+
+def enable_metrics():
+    metrics.enabled = True
+    return metrics
+
+
+def disable_metrics():
+    metrics.enabled = False
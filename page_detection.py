@@ -0,0 +1,368 @@
+# page_detection.py
+"""
+Mode « page entière » : détection et extraction de plusieurs signatures sur
+un document scanné (contrat, formulaire...).
+
+compute_roi suppose une seule signature par image : sur une page complète
+sa boîte engloberait le texte imprimé et tous les blocs de signature. Ici :
+
+1. la page est chargée une fois en niveaux de gris, à la résolution de
+   travail (load_normalized : décodage réduit si une cible est configurée) ;
+2. la détection travaille sur une copie réduite (plus grand côté
+   `detect_side`), par bandes de `tile` lignes : le seuil d'Otsu et le test
+   de fond sombre viennent de l'histogramme de toute la copie (un seul
+   seuil pour toutes les bandes), puis chaque bande est binarisée, ses
+   filets retirés (avec un recouvrement de la longueur d'un filet, le
+   résultat est identique à un traitement d'un bloc) et ses composantes
+   extraites tuile par tuile (connectedComponentsWithStats). Les
+   composantes coupées par un bord de tuile ou de bande sont recollées ;
+3. heuristiques : les filets et cadres (longues lignes droites) sont
+   d'abord retirés par ouverture morphologique ; la hauteur typique d'une
+   lettre imprimée est estimée (médiane des composantes) ; une composante
+   candidate est nettement plus haute et plus large qu'une lettre, ni trait
+   (très allongée) ni aplat (trop remplie). Les candidates proches sont
+   regroupées en régions, puis les régions trop denses (logos, tampons
+   pleins) sont écartées ;
+4. chaque région passe dans le pipeline existant (preprocess_pipeline),
+   en parallèle, puis toutes les features sont comparées à la galerie en
+   une seule requête vectorisée.
+
+Mémoire : la page en niveaux de gris à la résolution de travail reste
+chargée d'un bloc (1 octet par pixel) : les régions en sont des vues
+passées au pipeline, et le décodage PNG / JPEG d'OpenCV ne se fait pas par
+bandes. Sa taille se borne par load_normalized (target_dpi / max_side).
+La détection ajoute la copie réduite (1 octet par pixel, au plus
+detect_side de côté) et le travail d'une bande (~8 octets par pixel de
+tile + 2 x longueur de filet lignes de la copie), indépendants de la
+taille de la page au-delà de detect_side.
+
+    regions = process_page("contrat.png", gallery=load_gallery())
+    for r in regions:
+        print(r["box"], r["features"], r["match"])
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from features import extract_features
+from preprocessing import IMREAD_GRAYSCALE, load_normalized, preprocess_pipeline
+from reference_db import identify_many
+
+
+# -------- Boîtes --------
+
+def merge_boxes(boxes, gap=0):
+    """
+    Regroupe les boîtes (x0, y0, x1, y1), bornes x1/y1 exclues, qui se
+    touchent à `gap` pixels près. Retourne (boîtes fusionnées, groupe de
+    chaque boîte d'entrée).
+    """
+    boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+    n = len(boxes)
+    parent = np.arange(n)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i in range(n):
+        x0, y0, x1, y1 = boxes[i]
+        near = np.flatnonzero(
+            (boxes[i + 1:, 0] <= x1 + gap) & (boxes[i + 1:, 2] >= x0 - gap)
+            & (boxes[i + 1:, 1] <= y1 + gap) & (boxes[i + 1:, 3] >= y0 - gap)
+        ) + i + 1
+        for j in near:
+            ri, rj = find(i), find(j)
+            if ri != rj:
+                parent[rj] = ri
+
+    roots = np.array([find(i) for i in range(n)], dtype=np.intp)
+    uniq, groups = np.unique(roots, return_inverse=True)
+    merged = np.empty((len(uniq), 4), dtype=np.int64)
+    for g in range(len(uniq)):
+        members = boxes[groups == g]
+        merged[g] = (members[:, 0].min(), members[:, 1].min(),
+                     members[:, 2].max(), members[:, 3].max())
+    return merged, groups
+
+
+# -------- Composantes connexes par tuiles --------
+
+def _tile_components(block, tx, ty, w, h):
+    """
+    Composantes d'une tuile booléenne placée en (tx, ty) d'une image w x h :
+    (boîtes en coordonnées image, surfaces, touche un bord interne) ou None.
+    """
+    import cv2
+
+    n, _, stats, _ = cv2.connectedComponentsWithStats(block.astype(np.uint8), connectivity=8)
+    if n <= 1:
+        return None
+    st = stats[1:]
+    x0 = st[:, cv2.CC_STAT_LEFT] + tx
+    y0 = st[:, cv2.CC_STAT_TOP] + ty
+    x1 = x0 + st[:, cv2.CC_STAT_WIDTH]
+    y1 = y0 + st[:, cv2.CC_STAT_HEIGHT]
+    bh, bw = block.shape
+    border = (
+        ((x0 == tx) & (tx > 0)) | ((y0 == ty) & (ty > 0))
+        | ((x1 == tx + bw) & (tx + bw < w)) | ((y1 == ty + bh) & (ty + bh < h))
+    )
+    return np.stack([x0, y0, x1, y1], axis=1), st[:, cv2.CC_STAT_AREA], border
+
+
+def tiled_components(ink, tile=512, min_area=4):
+    """
+    Composantes connexes (8-connexité) d'une image booléenne d'encre, tuile
+    par tuile. Retourne (boîtes (n, 4) en coordonnées page, surfaces (n,)).
+    Les morceaux d'une même composante coupée par un bord de tuile sont
+    recollés.
+    """
+    h, w = ink.shape
+    parts = [_tile_components(ink[ty:ty + tile, tx:tx + tile], tx, ty, w, h)
+             for ty in range(0, h, tile) for tx in range(0, w, tile)]
+    return _stitch_components(parts, min_area)
+
+
+def _stitch_components(parts, min_area=4):
+    """Assemble les résultats de _tile_components et recolle les morceaux."""
+    parts = [p for p in parts if p is not None]
+    boxes = [p[0] for p in parts]
+    areas = [p[1] for p in parts]
+    on_border = [p[2] for p in parts]
+    if not boxes:
+        return np.empty((0, 4), dtype=np.int64), np.empty(0, dtype=np.int64)
+    boxes = np.concatenate(boxes).astype(np.int64)
+    areas = np.concatenate(areas).astype(np.int64)
+    on_border = np.concatenate(on_border)
+
+    # Recollage : seules les composantes touchant un bord interne sont concernées
+    if on_border.any():
+        idx = np.flatnonzero(on_border)
+        merged, groups = merge_boxes(boxes[idx], gap=1)
+        stitched_areas = np.bincount(groups, weights=areas[idx]).astype(np.int64)
+        keep = ~on_border
+        boxes = np.concatenate([boxes[keep], merged])
+        areas = np.concatenate([areas[keep], stitched_areas])
+
+    keep = areas >= min_area
+    return boxes[keep], areas[keep]
+
+
+# -------- Détection --------
+
+def remove_rules(ink, min_length):
+    """Retire les lignes droites horizontales / verticales d'au moins `min_length` px."""
+    import cv2
+
+    mask = ink.astype(np.uint8)
+    horizontal = cv2.morphologyEx(mask, cv2.MORPH_OPEN,
+                                  cv2.getStructuringElement(cv2.MORPH_RECT, (min_length, 1)))
+    vertical = cv2.morphologyEx(mask, cv2.MORPH_OPEN,
+                                cv2.getStructuringElement(cv2.MORPH_RECT, (1, min_length)))
+    return ink & ~((horizontal | vertical) > 0)
+
+
+def otsu_threshold(hist):
+    """Seuil d'Otsu (même règle que cv2.THRESH_OTSU) d'un histogramme 256 niveaux."""
+    p = hist.astype(np.float64) / max(hist.sum(), 1)
+    levels = np.arange(len(p))
+    q1 = np.cumsum(p)
+    m1 = np.cumsum(levels * p)
+    q2 = 1.0 - q1
+    eps = np.finfo(np.float32).eps
+    valid = (np.minimum(q1, q2) >= eps) & (np.maximum(q1, q2) <= 1.0 - eps)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mu1 = m1 / q1
+        mu2 = (m1[-1] - m1) / q2
+        sigma = np.where(valid, q1 * q2 * (mu1 - mu2) ** 2, 0.0)
+    return float(np.argmax(sigma)) if sigma.max() > 0 else 0.0
+
+
+def _ink_rows(small, y0, y1, otsu, dark, rule):
+    """
+    Masque d'encre, filets retirés, des lignes y0:y1 de la copie de
+    détection. L'ouverture verticale ne voit qu'à `rule` lignes : avec ce
+    recouvrement, le résultat est celui du traitement de toute la copie.
+    """
+    lo, hi = max(0, y0 - rule), min(small.shape[0], y1 + rule)
+    ink = small[lo:hi] < otsu
+    if dark:
+        ink = ~ink
+    return remove_rules(ink, rule)[y0 - lo:y1 - lo]
+
+
+def detect_signature_regions(gray, detect_side=2000, tile=512, min_height=2.5,
+                             min_width=3.0, max_elongation=15.0, max_fill=0.5,
+                             merge_gap=2.0, max_density=0.3, padding=0.5, rule_length=0.05):
+    """
+    Régions candidates (x0, y0, x1, y1) d'une page en niveaux de gris, en
+    coordonnées de `gray`.
+
+    detect_side : plus grand côté de la copie réduite utilisée pour la
+    détection (1 octet par pixel ; elle est traitée par bandes de `tile` lignes).
+    min_height, min_width : taille minimale d'une candidate, en hauteurs de lettre.
+    max_elongation : rapport max longueur / épaisseur (exclut les traits).
+    max_fill : part max de la boîte couverte d'encre (exclut les aplats).
+    merge_gap, padding : écart de regroupement et marge, en hauteurs de lettre.
+    max_density : densité d'encre max d'une région finale.
+    rule_length : longueur minimale d'un filet à retirer (fraction du plus grand côté).
+    """
+    import cv2
+
+    h, w = gray.shape
+    scale = min(1.0, detect_side / max(h, w))
+    small = gray if scale == 1.0 else cv2.resize(
+        gray, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA
+    )
+
+    # Seuil d'Otsu et fond sombre tirés de l'histogramme de toute la copie :
+    # un même seuil pour toutes les bandes
+    hist = cv2.calcHist([small], [0], None, [256], [0, 256]).ravel()
+    otsu = otsu_threshold(hist)
+    dark = hist[:int(np.ceil(otsu))].sum() > 0.5 * small.size
+    rule = max(15, int(rule_length * max(small.shape)))
+    sh, sw = small.shape
+
+    parts = []
+    for ty in range(0, sh, tile):
+        band = _ink_rows(small, ty, min(sh, ty + tile), otsu, dark, rule)
+        for tx in range(0, sw, tile):
+            parts.append(_tile_components(band[:, tx:tx + tile], tx, ty, sw, sh))
+        del band
+    boxes, areas = _stitch_components(parts)
+    if len(boxes) == 0:
+        return []
+
+    bw = boxes[:, 2] - boxes[:, 0]
+    bh = boxes[:, 3] - boxes[:, 1]
+    letter = max(2.0, float(np.median(bh)))  # hauteur typique du texte imprimé
+
+    long_side = np.maximum(bw, bh)
+    short_side = np.maximum(np.minimum(bw, bh), 1)
+    fill = areas / (bw * bh)
+    candidate = (
+        (bh >= min_height * letter)
+        & (bw >= min_width * letter)
+        & (long_side / short_side <= max_elongation)
+        & (fill <= max_fill)
+    )
+    if not candidate.any():
+        return []
+
+    regions, _ = merge_boxes(boxes[candidate], gap=int(merge_gap * letter))
+
+    results = []
+    pad = int(padding * letter)
+    for x0, y0, x1, y1 in regions:
+        x0, y0 = max(0, x0 - pad), max(0, y0 - pad)
+        x1, y1 = min(sw, x1 + pad), min(sh, y1 + pad)
+        if _ink_rows(small, y0, y1, otsu, dark, rule)[:, x0:x1].mean() > max_density:
+            continue
+        # Retour aux coordonnées de la page de travail
+        results.append((
+            int(x0 / scale), int(y0 / scale),
+            min(w, int(np.ceil(x1 / scale))), min(h, int(np.ceil(y1 / scale))),
+        ))
+    return sorted(results, key=lambda b: (b[1], b[0]))
+
+
+# -------- Extraction + comparaison --------
+
+def _process_region(gray, box):
+    # Tableau déjà à la résolution de travail : aucun rééchantillonnage ici
+    x0, y0, x1, y1 = box
+    roi, w, h = preprocess_pipeline(gray[y0:y1, x0:x1], debug=False)
+    if roi is None:
+        return None
+    return extract_features(roi, w, h)
+
+
+def process_page(source, gallery=None, workers=None, threshold=1000.0, k=1,
+                 target_dpi=None, max_side=None, source_dpi=None, pool=None, **detect_kwargs):
+    """
+    Détecte les signatures d'une page et les passe dans le pipeline.
+    source : chemin, octets encodés ou tableau NumPy.
+    gallery : index de référence (ex. enrollment.load_gallery()) ; si fourni,
+    chaque région reçoit ses `k` propriétaires les plus proches.
+    pool : SharedPreprocessPool (shm_pool.py) pour prétraiter les régions
+    dans des processus ; sinon pool de threads local.
+    Retourne [{"box", "width", "height", "features", "candidates", "match"}].
+    """
+    import cv2
+
+    gray, _ = load_normalized(source, IMREAD_GRAYSCALE, target_dpi, max_side, source_dpi)
+    if gray is None:
+        print("Erreur : page illisible.", file=sys.stderr)
+        return []
+    if gray.ndim == 3:
+        gray = cv2.cvtColor(gray, cv2.COLOR_BGR2GRAY)
+
+    boxes = detect_signature_regions(gray, **detect_kwargs)
+    if not boxes:
+        return []
+
+    if pool is not None:
+        features = [r["features"] for r in pool.map(
+            [np.ascontiguousarray(gray[y0:y1, x0:x1]) for x0, y0, x1, y1 in boxes])]
+    else:
+        with ThreadPoolExecutor(max_workers=workers or min(len(boxes), os.cpu_count() or 1)) as ex:
+            features = list(ex.map(lambda b: _process_region(gray, b), boxes))
+
+    regions = [
+        {"box": box, "width": f["width"], "height": f["height"], "features": f,
+         "candidates": [], "match": None}
+        for box, f in zip(boxes, features) if f is not None
+    ]
+    if gallery is not None and len(gallery) and regions:
+        rankings = identify_many([r["features"] for r in regions], gallery, k, threshold)
+        for region, ranking in zip(regions, rankings):
+            region["candidates"] = [
+                {"owner": c["owner"], "distance": c["distance"], "match": bool(c["match"])}
+                for c in ranking
+            ]
+            if ranking and ranking[0]["match"]:
+                region["match"] = ranking[0]["owner"]
+    return regions
+
+
+def draw_regions(page, regions, path):
+    """Image de contrôle : la page avec les régions détectées encadrées."""
+    import cv2
+
+    img = page if page.ndim == 3 else cv2.cvtColor(page, cv2.COLOR_GRAY2BGR)
+    img = img.copy()
+    for r in regions:
+        x0, y0, x1, y1 = r["box"]
+        cv2.rectangle(img, (x0, y0), (x1, y1), (0, 0, 255), 3)
+        label = r["match"] or "?"
+        cv2.putText(img, label, (x0, max(0, y0 - 8)), cv2.FONT_HERSHEY_SIMPLEX, 1.0,
+                    (0, 0, 255), 2)
+    cv2.imwrite(path, img)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Signatures d'une page scannée")
+    parser.add_argument("page")
+    parser.add_argument("--gallery", help="dossier d'échantillons enrôlés (identification)")
+    parser.add_argument("--max-side", type=float, help="résolution de travail (plus grand côté)")
+    parser.add_argument("--draw", help="image de contrôle avec les régions encadrées")
+    args = parser.parse_args()
+
+    gallery = None
+    if args.gallery:
+        from enrollment import load_gallery
+        gallery = load_gallery(args.gallery)
+
+    regions = process_page(args.page, gallery, max_side=args.max_side)
+    for i, r in enumerate(regions, 1):
+        owner = f" -> {r['match']}" if r["match"] else ""
+        print(f"{i}. boîte {r['box']}  ROI {r['width']}x{r['height']}{owner}")
+    if args.draw:
+        page, _ = load_normalized(args.page, IMREAD_GRAYSCALE, max_side=args.max_side)
+        draw_regions(page, regions, args.draw)
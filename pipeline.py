@@ -0,0 +1,260 @@
+# pipeline.py
+"""
+Pipeline unique à étapes nommées et interchangeables.
+
+Deux backends :
+- "opencv" : étapes de preprocessing.py (médian cv2, seuil adaptatif,
+  amincissement ximgproc / Zhang-Suen) ; c'est ce pipeline qu'exécute
+  preprocessing.preprocess_pipeline ;
+- "pil" : étapes de call_processing.py (médian PIL, seuil fixe 127,
+  skimage.skeletonize).
+
+À partir de l'étape "binarize", toutes les images respectent la même
+convention (uint8, 0 = noir/trait, 255 = blanc) et les features suivent le
+contrat features.SHAPE_FEATURE_KEYS : les deux backends sont comparables.
+
+`python pipeline.py img1 img2 ...` compare les backends (latence par étape
+et écart des features).
+"""
+import time
+
+import numpy as np
+
+import preprocessing
+from features import SHAPE_FEATURE_KEYS, extract_shape_features
+from metrics import metrics
+
+# "crop" : recadrage optionnel sur l'encre (None = étape sautée)
+STAGES = ("load", "crop", "denoise", "gray", "binarize", "skeletonize", "roi", "features")
+
+
+# -------- Étapes communes --------
+
+def roi_box(skeleton):
+    """Boîte (y0, y1, x0, x1) des pixels noirs, ou None si l'image est vide."""
+    mask = skeleton == 0
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    return int(rows[0]), int(rows[-1]) + 1, int(cols[0]), int(cols[-1]) + 1
+
+
+# -------- Backend PIL / skimage (call_processing.py) --------
+# PIL et skimage ne sont chargés qu'à la première exécution de ce backend
+
+def _pil_load(source):
+    from PIL import Image
+
+    if isinstance(source, Image.Image):
+        img = source
+    elif isinstance(source, np.ndarray):
+        img = Image.fromarray(source)
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        import io
+        img = Image.open(io.BytesIO(bytes(source)))
+    else:
+        img = Image.open(source)
+    # Le filtre médian PIL refuse les images palette / 1 bit
+    if img.mode not in ("L", "RGB"):
+        img = img.convert("RGB")
+    return img
+
+
+def _pil_denoise(image):
+    import call_processing
+    return call_processing.noise_removal(image)
+
+
+def _pil_gray(image):
+    import call_processing
+    return np.asarray(call_processing.convert_to_grayscale(image))
+
+
+def _pil_binarize(gray):
+    import call_processing
+    from PIL import Image
+
+    # call_processing.binarization met le trait à 255 : on inverse
+    ink_white = np.asarray(call_processing.binarization(Image.fromarray(gray)))
+    return 255 - ink_white
+
+
+def _pil_skeletonize(binary):
+    import call_processing
+    from PIL import Image
+
+    # call_processing.skeletonization squelettise les pixels < 128 (le trait)
+    # et renvoie le squelette à 255 : on inverse
+    skel_white = np.asarray(call_processing.skeletonization(Image.fromarray(binary)))
+    return 255 - skel_white
+
+
+def _opencv_load(source):
+    return preprocessing.load_image(source)
+
+
+BACKENDS = {
+    "opencv": {
+        "load": _opencv_load,
+        "crop": None,
+        "denoise": preprocessing.remove_noise,
+        "gray": preprocessing.convert_to_grayscale,
+        "binarize": preprocessing.binarize_image,
+        "skeletonize": preprocessing.skeletonize_image,
+        "roi": roi_box,
+        "features": extract_shape_features,
+    },
+    "pil": {
+        "load": _pil_load,
+        "crop": None,
+        "denoise": _pil_denoise,
+        "gray": _pil_gray,
+        "binarize": _pil_binarize,
+        "skeletonize": _pil_skeletonize,
+        "roi": roi_box,
+        "features": extract_shape_features,
+    },
+}
+
+
+# -------- Pipeline --------
+
+class Pipeline:
+    """
+    Enchaîne les étapes STAGES. `stages` remplace des étapes par nom, ex. :
+        Pipeline("opencv", skeletonize=lambda b: skeletonize_image(b, "guo-hall"))
+    Une étape à None est sautée (crop par défaut ; features=None : pas de features).
+    Chaque étape est chronométrée et publiée dans metrics sous son nom.
+    """
+
+    def __init__(self, backend="opencv", **stages):
+        if backend not in BACKENDS:
+            raise ValueError(f"Backend inconnu : {backend}")
+        unknown = set(stages) - set(STAGES)
+        if unknown:
+            raise ValueError(f"Étapes inconnues : {sorted(unknown)}")
+        self.backend = backend
+        self.stages = dict(BACKENDS[backend], **stages)
+
+    def run(self, source, keep_images=False):
+        """
+        Retourne un dictionnaire :
+        roi, width, height, features, timings (ms par étape), failed (étape
+        qui n'a rien produit : "load", "crop" ou "roi", sinon None) et, si
+        keep_images, images {étape: image intermédiaire}.
+        roi vaut None (et width = height = 0) si l'image est illisible ou vide.
+        """
+        st = self.stages
+        timings = {}
+        images = {}
+        result = {"roi": None, "width": 0, "height": 0, "features": None,
+                  "timings": timings, "failed": None}
+        if keep_images:
+            result["images"] = images
+
+        def timed(name, *args):
+            t0 = time.perf_counter()
+            out = st[name](*args)
+            timings[name] = 1000 * (time.perf_counter() - t0)
+            metrics.observe(name, timings[name])
+            if keep_images:
+                images[name] = out
+            return out
+
+        img = timed("load", source)
+        if img is None:
+            result["failed"] = "load"
+            return result
+        if st["crop"] is not None:
+            img = timed("crop", img)
+            if img is None:
+                result["failed"] = "crop"
+                return result
+        img = timed("denoise", img)
+        gray = timed("gray", img)
+        binary = timed("binarize", gray)
+        skeleton = timed("skeletonize", binary)
+        box = timed("roi", skeleton)
+        if box is None:
+            result["failed"] = "roi"
+            return result
+
+        y0, y1, x0, x1 = box
+        roi = skeleton[y0:y1, x0:x1]
+        feats = None
+        if st["features"] is not None:
+            feats = timed("features", roi, binary[y0:y1, x0:x1])
+        result.update(roi=roi, width=x1 - x0, height=y1 - y0, features=feats)
+        return result
+
+    def __call__(self, source):
+        """Même contrat que preprocess_pipeline : (roi, width, height)."""
+        r = self.run(source)
+        return r["roi"], r["width"], r["height"]
+
+
+# -------- Comparaison des backends --------
+
+def compare_backends(sources, backends=("opencv", "pil"), repeat=3):
+    """
+    Exécute chaque backend sur les mêmes images.
+    Retourne :
+    - latency_ms[backend][étape] : temps moyen par image ;
+    - agreement[backend][clé] : écart relatif moyen entre le 1er backend et
+      les autres, pour chaque feature du contrat commun ;
+    - failures[backend] : nombre d'images sans ROI.
+    """
+    pipelines = {name: Pipeline(name) for name in backends}
+    latency = {name: dict.fromkeys(STAGES, 0.0) for name in backends}
+    failures = dict.fromkeys(backends, 0)
+    features = {name: [] for name in backends}
+
+    for source in sources:
+        for name, pipe in pipelines.items():
+            for _ in range(repeat):
+                r = pipe.run(source)
+                for stage, ms in r["timings"].items():
+                    latency[name][stage] += ms / (repeat * len(sources))
+            features[name].append(r["features"])
+            if r["features"] is None:
+                failures[name] += 1
+
+    base = backends[0]
+    agreement = {}
+    for other in backends[1:]:
+        diffs = {k: [] for k in SHAPE_FEATURE_KEYS}
+        for fa, fb in zip(features[base], features[other]):
+            if fa is None or fb is None:
+                continue
+            for k in SHAPE_FEATURE_KEYS:
+                scale = max(abs(fa[k]), abs(fb[k]), 1e-9)
+                diffs[k].append(abs(fa[k] - fb[k]) / scale)
+        agreement[other] = {
+            k: float(np.mean(v)) if v else None for k, v in diffs.items()
+        }
+
+    return {"latency_ms": latency, "agreement": agreement, "failures": failures}
+
+
+def print_comparison(report):
+    latency = report["latency_ms"]
+    names = list(latency)
+    print(f"{'étape':12s}" + "".join(f"{n:>12s}" for n in names))
+    for stage in STAGES:
+        print(f"{stage:12s}" + "".join(f"{latency[n][stage]:10.2f}ms" for n in names))
+    total = {n: sum(latency[n].values()) for n in names}
+    print(f"{'total':12s}" + "".join(f"{total[n]:10.2f}ms" for n in names))
+    print("échecs      " + "".join(f"{report['failures'][n]:12d}" for n in names))
+
+    for other, diffs in report["agreement"].items():
+        print(f"\nÉcart relatif moyen {names[0]} / {other} :")
+        for k, v in diffs.items():
+            print(f"  {k:14s} {'-' if v is None else f'{v:.1%}'}")
+
+
+if __name__ == "__main__":
+    import sys
+
+    paths = sys.argv[1:] or ["image_test.png", "signature_selsabil.png", "bb.jpg"]
+    print_comparison(compare_backends(paths))
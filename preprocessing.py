@@ -1,12 +1,193 @@
-import cv2
+import io
+import os
+import sys
+
 import numpy as np
-from PIL import Image
+
+from debug_artifacts import get_sink
+from thinning import thin
+
+# Version du pipeline : à incrémenter dès qu'une étape change le résultat
+# (invalide les caches de features de référence).
+PIPELINE_VERSION = "2"
+
+
+def _env_number(name):
+    value = os.environ.get(name, "")
+    return float(value) if value else None
+
+
+# Résolution de travail par défaut (None = résolution d'origine).
+# Les features étant des comptes de pixels, une même résolution cible rend
+# comparables des scans faits à des DPI différents.
+TARGET_DPI = _env_number("SIGNATURE_TARGET_DPI")
+MAX_SIDE = _env_number("SIGNATURE_MAX_SIDE")
+
+# Valeurs de cv2.IMREAD_COLOR / cv2.IMREAD_GRAYSCALE : cv2 (et PIL) ne sont
+# importés qu'au premier chargement d'image, pas à l'import du module.
+IMREAD_COLOR = 1
+IMREAD_GRAYSCALE = 0
+
+# Orientations EXIF (tag 0x0112) avec rotation d'un quart de tour :
+# OpenCV les applique au décodage, largeur et hauteur sont échangées
+_EXIF_ORIENTATION = 0x0112
+_EXIF_TRANSPOSED = (5, 6, 7, 8)
+
+
+def _reduced_flag(flags, reduction):
+    """Décodage réduit natif d'OpenCV (JPEG : réduction dans le domaine DCT)."""
+    import cv2
+
+    names = {IMREAD_COLOR: "IMREAD_REDUCED_COLOR_", IMREAD_GRAYSCALE: "IMREAD_REDUCED_GRAYSCALE_"}
+    if flags not in names or reduction not in (2, 4, 8):
+        return None
+    return getattr(cv2, names[flags] + str(reduction))
+
+
+# -------- Phase 0 : chargement (chemin, octets encodés ou tableau) --------
+
+def decode_image(data, flags=IMREAD_COLOR):
+    """Décode une image encodée (PNG, JPEG...) reçue en mémoire."""
+    import cv2
+
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if buf.size == 0:
+        return None
+    return cv2.imdecode(buf, flags)
+
+
+def load_image(source, flags=IMREAD_COLOR):
+    """
+    Charge une image depuis un chemin, des octets encodés ou un tableau NumPy.
+    Les tableaux sont utilisés tels quels (pas de copie si déjà en uint8).
+    Retourne None si l'image est illisible.
+    """
+    import cv2
+
+    if isinstance(source, np.ndarray):
+        img = source
+        if img.dtype == bool:
+            img = img.astype(np.uint8) * 255
+        elif img.dtype != np.uint8:
+            img = np.clip(img, 0, 255).astype(np.uint8)
+        if img.ndim == 3 and img.shape[2] == 4:
+            img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+        if flags == IMREAD_GRAYSCALE:
+            img = convert_to_grayscale(img)
+        return img
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return decode_image(source, flags)
+
+    return cv2.imread(str(source), flags)
+
+
+def read_image_info(source):
+    """
+    (largeur, hauteur, dpi) lus dans l'en-tête sans décoder les pixels
+    (dpi = None si absent). Largeur et hauteur sont celles de l'image
+    décodée par OpenCV, orientation EXIF appliquée.
+    Retourne None si l'en-tête est illisible.
+    """
+    from PIL import Image
+
+    try:
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = io.BytesIO(bytes(source))
+        with Image.open(source) as img:
+            dpi = img.info.get("dpi")
+            dpi = float(dpi[0]) if dpi and dpi[0] else None
+            width, height = img.size
+            if img.getexif().get(_EXIF_ORIENTATION) in _EXIF_TRANSPOSED:
+                width, height = height, width
+            return width, height, dpi
+    except (OSError, ValueError, TypeError):
+        return None
+
+
+def resolution_params(target_dpi=None, max_side=None):
+    """Réglages de résolution effectifs (valeurs par défaut du module sinon)."""
+    return {
+        "target_dpi": target_dpi or TARGET_DPI,
+        "max_side": max_side or MAX_SIDE,
+    }
+
+
+def resolution_scale(width, height, dpi=None, target_dpi=None, max_side=None):
+    """
+    Facteur d'échelle vers la résolution cible :
+    - target_dpi : ramène l'image de `dpi` à `target_dpi` (ignoré si dpi inconnu) ;
+    - max_side : borne le plus grand côté (et donc le coût par image).
+    """
+    scale = 1.0
+    if target_dpi and dpi:
+        scale = target_dpi / dpi
+    if max_side:
+        scale = min(scale, max_side / max(width, height))
+    return scale
+
+
+def load_normalized(source, flags=IMREAD_COLOR, target_dpi=None, max_side=None,
+                    source_dpi=None):
+    """
+    Comme load_image, mais à la résolution cible : l'image est décodée
+    directement réduite (IMREAD_REDUCED_* : 1/2, 1/4, 1/8) quand c'est
+    possible, puis rééchantillonnée à la taille exacte.
+    source_dpi : DPI de la source si l'en-tête n'en donne pas (ou pour un tableau).
+    Retourne (image, échelle appliquée) ou (None, 0.0).
+    """
+    import cv2
+
+    params = resolution_params(target_dpi, max_side)
+    if not params["target_dpi"] and not params["max_side"]:
+        img = load_image(source, flags)
+        return img, (1.0 if img is not None else 0.0)
+
+    info = None if isinstance(source, np.ndarray) else read_image_info(source)
+    if info is not None:
+        width, height, dpi = info
+        scale = resolution_scale(width, height, source_dpi or dpi, **params)
+        # Plus forte réduction native qui reste au-dessus de la taille cible
+        reduction = next((r for r in (8, 4, 2) if scale * r <= 1.0), 1)
+        reduced = _reduced_flag(flags, reduction) if reduction > 1 else None
+        if reduced is not None:
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                img = decode_image(source, reduced)
+            else:
+                img = cv2.imread(str(source), reduced)
+        else:
+            img = load_image(source, flags)
+    else:
+        img = load_image(source, flags)
+        if img is None:
+            return None, 0.0
+        height, width = img.shape[:2]
+        scale = resolution_scale(width, height, source_dpi, **params)
+    if img is None:
+        return None, 0.0
+
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    if (img.shape[1], img.shape[0]) != size:
+        shrink = size[0] < img.shape[1]
+        img = cv2.resize(img, size, interpolation=cv2.INTER_AREA if shrink else cv2.INTER_LINEAR)
+    return img, scale
+
+
+def describe_source(source):
+    """Description courte d'une entrée, pour les logs et messages d'erreur."""
+    if isinstance(source, np.ndarray):
+        return f"<tableau {'x'.join(str(n) for n in source.shape)}>"
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return f"<{len(source)} octets>"
+    return str(source)
 
 
 # -------- Phase 1 : bruit + niveaux de gris --------
 
 def remove_noise(image):
     """Applique un filtre médian pour enlever le bruit."""
+    import cv2
+
     # kernel 3x3 (doit être impair)
     denoised = cv2.medianBlur(image, 3)
     return denoised
@@ -14,6 +195,8 @@ def remove_noise(image):
 
 def convert_to_grayscale(image):
     """Convertit en niveau de gris si nécessaire."""
+    import cv2
+
     if len(image.shape) == 3:  # image couleur BGR
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
     else:
@@ -28,6 +211,8 @@ def binarize_image(gray):
     Binarisation adaptative : image binaire
     signature noire (0), fond blanc (255).
     """
+    import cv2
+
     bw = cv2.adaptiveThreshold(
         gray,
         255,
@@ -44,33 +229,17 @@ def binarize_image(gray):
     return bw
 
 
-def skeletonize_image(binary):
+def skeletonize_image(binary, method=None):
     """
     Squelettisation (amincissement) pour obtenir des traits de 1 pixel.
-    Utilise cv2.ximgproc.thinning si disponible, sinon une version simple.
+    method : "ximgproc", "zhang-suen", "guo-hall" ou "morphological" (voir
+    thinning.py). Par défaut cv2.ximgproc.thinning si disponible, sinon
+    le Zhang-Suen intégré.
     """
-    # On suppose binaire 0/255, on convertit en 0/1
+    # On suppose binaire 0/255 : le trait (noir) devient 255 pour l'amincissement
     bin01 = (binary == 0).astype(np.uint8) * 255
 
-    try:
-        # OpenCV contrib: ximgproc.thinning
-        import cv2.ximgproc as ximgproc
-        skel = ximgproc.thinning(bin01)
-    except Exception:
-        # Version morphologique simple (moins parfaite mais suffisante)
-        img = bin01.copy()
-        skel = np.zeros_like(img)
-        element = cv2.getStructuringElement(cv2.MORPH_CROSS, (3, 3))
-
-        while True:
-            eroded = cv2.erode(img, element)
-            temp = cv2.dilate(eroded, element)
-            temp = cv2.subtract(img, temp)
-            skel = cv2.bitwise_or(skel, temp)
-            img = eroded.copy()
-
-            if cv2.countNonZero(img) == 0:
-                break
+    skel = thin(bin01, method)
 
     # On revient à 0 = noir, 255 = blanc
     skel = (skel == 0).astype(np.uint8) * 255
@@ -101,63 +270,170 @@ def compute_roi(image):
     return roi, int(width), int(height)
 
 
+def find_ink_bbox(image, scale=4, padding=16, ink_delta=40):
+    """
+    Pré-passe grossière : boîte (y0, y1, x0, x1) de l'encre, avec marge,
+    calculée sur une version réduite de l'image (INTER_AREA) puis par
+    réduction lignes / colonnes. Retourne None si aucune encre.
+
+    La marge doit couvrir le voisinage du seuillage adaptatif (11x11) et du
+    filtre médian pour que le résultat dans la boîte soit le même que sur
+    l'image entière.
+    """
+    import cv2
+
+    gray = convert_to_grayscale(image)
+    h, w = gray.shape
+    scale = max(1, int(scale))
+    small = cv2.resize(
+        gray,
+        (max(1, w // scale), max(1, h // scale)),
+        interpolation=cv2.INTER_AREA,
+    )
+
+    # Encre = nettement plus sombre que le papier (ou plus claire si fond noir)
+    bg = float(np.median(small))
+    if bg >= 127:
+        ink = small < bg - ink_delta
+    else:
+        ink = small > bg + ink_delta
+
+    rows = np.flatnonzero(ink.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(ink.any(axis=0))
+
+    # Retour aux coordonnées d'origine (+ une cellule réduite + la marge)
+    sy, sx = h / small.shape[0], w / small.shape[1]
+    y0 = max(0, int(rows[0] * sy) - padding)
+    y1 = min(h, int((rows[-1] + 1) * sy + 1) + padding)
+    x0 = max(0, int(cols[0] * sx) - padding)
+    x1 = min(w, int((cols[-1] + 1) * sx + 1) + padding)
+    return y0, y1, x0, x1
+
+
 # -------- Phase 4 : utilitaires + pipeline complet --------
 
 def save_processed_image(image, filename):
     """Sauvegarde une image NumPy en PNG avec PIL."""
+    from PIL import Image
+
     if image is None:
         return
     img_pil = Image.fromarray(image)
     img_pil.save(filename)
 
 
-def preprocess_pipeline(path):
+def preprocess_pipeline(path, debug=None, thinning=None, crop_to_ink=False,
+                        target_dpi=None, max_side=None, source_dpi=None):
     """
     Pipeline complet du module 2.
+    path : chemin, octets encodés ou tableau NumPy (voir load_image).
     Retourne (roi, width, height) ou (None, 0, 0) en cas d'erreur.
+
+    debug : sink d'images intermédiaires (voir debug_artifacts) ;
+    None = sink global (désactivé par défaut), False = aucune écriture.
+    thinning : moteur de squelettisation (voir skeletonize_image).
+    crop_to_ink : recadre d'abord sur l'encre (find_ink_bbox) pour ne pas
+    filtrer / binariser / squelettiser le papier vide.
+    target_dpi, max_side, source_dpi : résolution de travail (voir
+    load_normalized ; défauts SIGNATURE_TARGET_DPI / SIGNATURE_MAX_SIDE).
     """
-    # Charger l'image
-    img = cv2.imread(path)
-    if img is None:
-        print("Erreur : image introuvable ->", path)
+    # Les étapes sont celles du backend "opencv" de pipeline.Pipeline ;
+    # seuls le chargement (résolution cible), le recadrage et le moteur
+    # d'amincissement sont propres à cet appel.
+    from pipeline import Pipeline
+
+    def load(source):
+        img, _ = load_normalized(source, target_dpi=target_dpi, max_side=max_side,
+                                 source_dpi=source_dpi)
+        return img
+
+    def crop(img):
+        box = find_ink_bbox(img)
+        if box is None:
+            return None
+        y0, y1, x0, x1 = box
+        return img[y0:y1, x0:x1]
+
+    sink = get_sink() if debug is None else debug
+    pipe = Pipeline(
+        "opencv", load=load, crop=crop if crop_to_ink else None,
+        skeletonize=lambda binary: skeletonize_image(binary, thinning), features=None,
+    )
+    result = pipe.run(path, keep_images=bool(sink))
+    if result["failed"] == "load":
+        print("Erreur : image introuvable ->", describe_source(path), file=sys.stderr)
         return None, 0, 0
-
-    # Phase 1
-    denoised = remove_noise(img)
-    gray = convert_to_grayscale(denoised)
-
-    # Phase 2
-    binary = binarize_image(gray)
-    skeleton = skeletonize_image(binary)
-
-    # Phase 3
-    roi, w, h = compute_roi(skeleton)
+    roi, w, h = result["roi"], result["width"], result["height"]
     if roi is None or w == 0 or h == 0:
-        print("Erreur : ROI vide après traitement.")
+        print("Erreur : ROI vide après traitement.", file=sys.stderr)
         return None, 0, 0
 
-    # Phase 4 : sauvegarde optionnelle pour debug
-    save_processed_image(denoised, "step1_denoised.png")
-    save_processed_image(gray, "step2_gray.png")
-    save_processed_image(binary, "step3_binary.png")
-    save_processed_image(skeleton, "step4_skeleton.png")
-    save_processed_image(roi, "step5_roi.png")
+    # Sauvegarde optionnelle pour debug (thread d'arrière-plan)
+    if sink:
+        images = result["images"]
+        sink.submit([
+            ("step1_denoised.png", images["denoise"]),
+            ("step2_gray.png", images["gray"]),
+            ("step3_binary.png", images["binarize"]),
+            ("step4_skeleton.png", images["skeletonize"]),
+            ("step5_roi.png", roi),
+        ])
 
-    return roi, w, h
+    return roi, int(w), int(h)
 
 
 # -------- Alias utilisé par verification.py --------
 
-def preprocess_signature(path):
+def preprocess_signature(path, **kwargs):
     """
     Wrapper pour rester compatible avec verification.py
     """
-    return preprocess_pipeline(path)
+    return preprocess_pipeline(path, **kwargs)
 
 
 # -------- Test rapide du module 2 --------
 
+def _resolution_check(target_dpi=200):
+    """
+    Même signature enregistrée en JPEG à 150, 300 et 600 DPI, et à 600 DPI
+    avec une orientation EXIF d'un quart de tour : même ROI à target_dpi.
+    """
+    from PIL import Image
+
+    from synthetic_signatures import synthetic_signature
+
+    base = synthetic_signature(1200, 480, strokes=4, thickness=6, seed=1)
+    rois = {}
+    for dpi, orientation in ((150, 1), (300, 1), (600, 1), (600, 6)):
+        side = dpi / 600
+        img = Image.fromarray(base).convert("L").resize(
+            (round(1200 * side), round(480 * side)), Image.LANCZOS)
+        exif = Image.Exif()
+        if orientation != 1:
+            # Pixels tournés de 90° à l'enregistrement, l'EXIF les redresse
+            img = img.transpose(Image.ROTATE_90)
+            exif[_EXIF_ORIENTATION] = orientation
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=95, dpi=(dpi, dpi), exif=exif.tobytes())
+        roi, w, h = preprocess_pipeline(buf.getvalue(), debug=False, target_dpi=target_dpi)
+        rois[(dpi, orientation)] = (w, h)
+        print(f"{dpi} dpi, orientation EXIF {orientation} : ROI {w} x {h}")
+    widths = [w for w, h in rois.values()]
+    heights = [h for w, h in rois.values()]
+    assert max(widths) - min(widths) <= 2 and max(heights) - min(heights) <= 2, rois
+
+
 if __name__ == "__main__":
+    if "--resolution" in sys.argv:
+        _resolution_check()
+        sys.exit(0)
+
+    from debug_artifacts import enable_debug_artifacts
+
+    sink = enable_debug_artifacts()
     roi, w, h = preprocess_pipeline("image_test.png")
+    sink.flush()
     print("ROI width :", w)
     print("ROI height:", h)
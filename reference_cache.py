@@ -0,0 +1,248 @@
+# reference_cache.py
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from preprocessing import (
+    PIPELINE_VERSION,
+    describe_source,
+    preprocess_signature,
+    resolution_params,
+)
+from features import extract_features
+
+# Dossier du cache disque (modifiable via la variable d'environnement)
+CACHE_DIR = os.environ.get("SIGNATURE_CACHE_DIR", "cache")
+
+# Références gardées en mémoire (les plus anciennes restent sur disque)
+MAX_ENTRIES = 256
+
+
+def file_hash(path):
+    """Empreinte SHA-256 du contenu d'un fichier."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def data_hash(source):
+    """Empreinte SHA-256 d'octets encodés ou d'un tableau NumPy."""
+    h = hashlib.sha256()
+    if isinstance(source, np.ndarray):
+        h.update(f"{source.dtype}{source.shape}".encode("ascii"))
+        h.update(np.ascontiguousarray(source).data)
+    else:
+        h.update(source)
+    return h.hexdigest()
+
+
+def cache_key(content_hash, params=None):
+    """
+    Clé du cache : contenu de l'image + version du pipeline + paramètres
+    (dont la résolution de travail effective, défauts du module compris).
+    Si l'un d'eux change, l'ancienne entrée n'est plus jamais relue.
+    """
+    params = params or {}
+    payload = json.dumps(
+        {
+            "content": content_hash,
+            "pipeline": PIPELINE_VERSION,
+            "params": params,
+            "resolution": resolution_params(params.get("target_dpi"), params.get("max_side")),
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ReferenceCache:
+    """
+    Cache des références prétraitées : (roi, width, height, features).
+    Deux niveaux : un LRU en mémoire (`max_entries` références, la moins
+    récemment utilisée sort) et des fichiers .npz sur disque.
+    Le verrou ne protège que les tables en mémoire : prétraitement et
+    lectures / écritures disque se font hors du verrou. Un seul thread
+    calcule une clé donnée, les autres attendent son résultat.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, use_disk=True, max_entries=MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.use_disk = use_disk
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        # (chemin, taille, mtime) -> hash : évite de relire un fichier inchangé
+        self._hashes = OrderedDict()
+        self._pending = {}  # clé en cours de calcul -> threading.Event
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _bounded_put(cache, key, value, limit):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > limit:
+            cache.popitem(last=False)
+
+    # ---------- Clés ----------
+
+    def _content_hash(self, path):
+        if isinstance(path, (np.ndarray, bytes, bytearray, memoryview)):
+            return data_hash(path)
+        st = os.stat(path)
+        stamp = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+        with self._lock:
+            digest = self._hashes.get(stamp)
+            if digest is not None:
+                self._hashes.move_to_end(stamp)
+                return digest
+        digest = file_hash(path)
+        with self._lock:
+            # Un fichier réécrit laisse d'anciennes empreintes : bornées aussi
+            self._bounded_put(self._hashes, stamp, digest, 16 * self.max_entries)
+        return digest
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, key + ".npz")
+
+    # ---------- Disque ----------
+
+    def _load_from_disk(self, key):
+        path = self._disk_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                roi = data["roi"]
+                meta = json.loads(str(data["meta"]))
+        except Exception:
+            # Entrée corrompue : on la recalculera
+            return None
+        return roi, meta["width"], meta["height"], meta["features"]
+
+    def _save_to_disk(self, key, entry):
+        roi, w, h, feats = entry
+        meta = json.dumps({"width": w, "height": h, "features": feats})
+        tmp = None
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Fichier temporaire propre à l'écrivain (plusieurs processus
+            # peuvent écrire la même clé), puis remplacement atomique : un
+            # lecteur ne voit jamais un fichier partiel
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".npz")
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, roi=roi, meta=np.array(meta))
+            os.replace(tmp, self._disk_path(key))
+        except OSError as e:
+            # Le disque n'est qu'un cache : la référence reste utilisable
+            print(f"Erreur : référence non mise en cache sur disque ({e})", file=sys.stderr)
+            if tmp is not None and os.path.exists(tmp):
+                os.remove(tmp)
+
+    # ---------- API ----------
+
+    def get(self, path, **params):
+        """
+        Retourne (roi, width, height, features) pour l'image de référence
+        (chemin, octets encodés ou tableau NumPy).
+        Ne relance le prétraitement que si le contenu ou le pipeline a changé.
+        """
+        if isinstance(path, str) and not os.path.exists(path):
+            print("Erreur : image introuvable ->", describe_source(path), file=sys.stderr)
+            return None, 0, 0, None
+        key = cache_key(self._content_hash(path), params)
+
+        while True:
+            with self._lock:
+                entry = self._memory.get(key)
+                if entry is not None:
+                    self._memory.move_to_end(key)
+                    return entry
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = self._pending[key] = threading.Event()
+                    break
+            # Un autre thread calcule cette clé : on attend puis on relit
+            pending.wait()
+            with self._lock:
+                entry = self._memory.get(key)
+            if entry is not None:
+                return entry
+            # Échec de l'autre thread (ou entrée déjà évincée) : on réessaie
+
+        try:
+            entry = self._load_from_disk(key) if self.use_disk else None
+            if entry is None:
+                roi, w, h = preprocess_signature(path, **params)
+                if roi is None:
+                    return None, 0, 0, None
+                feats = extract_features(roi, w, h)
+                entry = (roi, w, h, feats)
+                if self.use_disk:
+                    self._save_to_disk(key, entry)
+            with self._lock:
+                self._bounded_put(self._memory, key, entry, self.max_entries)
+            return entry
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.set()
+
+    def warm_up(self, paths, **params):
+        """Précharge une liste de références (à appeler au démarrage)."""
+        if isinstance(paths, str):
+            paths = [paths]
+        loaded = 0
+        for path in paths:
+            if isinstance(path, str) and not os.path.exists(path):
+                continue
+            roi, _, _, _ = self.get(path, **params)
+            if roi is not None:
+                loaded += 1
+        return loaded
+
+    def clear(self, disk=False):
+        """Vide le cache mémoire (et le cache disque si disk=True)."""
+        with self._lock:
+            self._memory.clear()
+            self._hashes.clear()
+        if disk and os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".npz"):
+                    try:
+                        os.remove(os.path.join(self.cache_dir, name))
+                    except OSError:
+                        pass
+
+
+# Instance partagée par verification.py et la GUI
+default_cache = ReferenceCache()
+
+
+def get_reference(path, **params):
+    return default_cache.get(path, **params)
+
+
+def warm_up(paths, **params):
+    return default_cache.warm_up(paths, **params)
+
+
+def reference_id(path):
+    """Identifiant d'une référence : empreinte de son contenu (pas son chemin)."""
+    return default_cache._content_hash(path)
+
+
+if __name__ == "__main__":
+    import time
+
+    default_cache.clear(disk=True)
+    for label in ("froid", "chaud"):
+        t0 = time.perf_counter()
+        roi, w, h, feats = get_reference("signature_selsabil.png")
+        print(f"{label}: {1000 * (time.perf_counter() - t0):.2f} ms -> {feats}")
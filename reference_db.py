@@ -1,27 +1,397 @@
 # reference_db.py (Phase 4)
+import hashlib
 import os
 import numpy as np
-import cv2
+from ann_index import IVFIndex
+from feature_store import FeatureStore
 from features import extract_basic_features, extract_advanced_features
+from preprocessing import IMREAD_GRAYSCALE, load_image as load_source
 
 REF_FOLDER = "references"
+IMAGE_EXTENSIONS = (".png", ".jpg")
+
+# Ordre des colonnes de la matrice de features
+FEATURE_KEYS = ("width", "height", "black_pixels")
+
+# Taille max (en float32) d'un bloc requêtes x références x features
+_BLOCK_ELEMENTS = 1 << 22
+
 
 def load_image(path):
-    img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    """Chemin, octets encodés ou tableau -> image binaire 0/1 (None si illisible)."""
+    import cv2
+
+    img = load_source(path, IMREAD_GRAYSCALE)
+    if img is None:
+        return None
     _, binary = cv2.threshold(img, 127, 1, cv2.THRESH_BINARY)
     return binary
 
-def load_references():
-    """Charge toutes les images de référence et extrait leurs features"""
-    references = []
-    for filename in os.listdir(REF_FOLDER):
-        if filename.endswith(".png") or filename.endswith(".jpg"):
-            path = os.path.join(REF_FOLDER, filename)
-            image = load_image(path)
-            features = extract_basic_features(image)
-            # features.update(extract_advanced_features(image))  # optionnel
-            references.append({"name": filename, "features": features})
-    return references
+
+# -------- Index vectorisé --------
+
+class ReferenceIndex:
+    """
+    Index des références : une matrice float32 contiguë (une ligne par
+    référence) + la liste des entrées {"name", "features", ...}.
+    Se parcourt comme l'ancienne liste de dictionnaires.
+
+    backend : "numpy" (scan exact), "kdtree" (scipy.spatial.cKDTree,
+    repli sur numpy si scipy est absent) ou "ivf" (recherche approchée,
+    voir ann_index.py ; ann_options = paramètres d'IVFIndex, ex. nprobe).
+    normalize : divise chaque feature par son écart-type avant le calcul
+    des distances (sinon distance brute en pixels, comme compare_features).
+    """
+
+    def __init__(self, feature_keys=FEATURE_KEYS, backend="numpy", normalize=False,
+                 ann_options=None):
+        self.feature_keys = tuple(feature_keys)
+        self.backend = backend
+        self.normalize = normalize
+        self.ann_options = dict(ann_options or {})
+        self.ann = None
+        self.entries = []
+        self.matrix = np.empty((0, len(self.feature_keys)), dtype=np.float32)
+        self.scale = np.ones(len(self.feature_keys), dtype=np.float32)
+        self._scaled = self.matrix
+        self._tree = None
+        self._owner_rows = None
+        self._prefilter = None
+
+    @classmethod
+    def from_references(cls, references, **kwargs):
+        index = cls(**kwargs)
+        index.add_many(references)
+        return index
+
+    @classmethod
+    def from_matrix(cls, matrix, entries, feature_keys=FEATURE_KEYS, **kwargs):
+        """Index sur une matrice existante (ex. memmap) sans la copier."""
+        index = cls(feature_keys, **kwargs)
+        index.matrix = matrix
+        index.entries = entries
+        index._rebuild()
+        return index
+
+    @classmethod
+    def from_store(cls, store, **kwargs):
+        """Index sur un FeatureStore (matrice partagée via memory-map)."""
+        return cls.from_matrix(store.matrix, store.entries, store.feature_keys, **kwargs)
+
+    # ---------- Construction ----------
+
+    def vectorize(self, features):
+        """dict de features (ou liste de dicts) -> matrice float32 (n, d)."""
+        if isinstance(features, dict):
+            features = [features]
+        return np.array(
+            [[f[k] for k in self.feature_keys] for f in features],
+            dtype=np.float32,
+        ).reshape(-1, len(self.feature_keys))
+
+    def add(self, name, features, **meta):
+        self.add_many([dict(meta, name=name, features=features)])
+
+    def add_many(self, references):
+        references = list(references)
+        if not references:
+            return
+        rows = self.vectorize([r["features"] for r in references])
+        if not isinstance(self.entries, list):
+            self.entries = list(self.entries)
+        self.entries.extend(references)
+        self.matrix = np.ascontiguousarray(np.vstack([self.matrix, rows]))
+        self._rebuild(added=len(rows))
+
+    def _rebuild(self, added=0):
+        """
+        Recalcule la normalisation et, si besoin, l'arbre KD ou l'index IVF.
+        added : lignes ajoutées en fin de matrice depuis le dernier appel ;
+        l'index IVF existant les range alors sans nouveau k-means.
+        """
+        ann, old_scale = self.ann, self.scale
+        if self.normalize and len(self.matrix) > 1:
+            std = self.matrix.std(axis=0)
+            self.scale = np.where(std > 0, std, 1.0).astype(np.float32)
+        else:
+            self.scale = np.ones(len(self.feature_keys), dtype=np.float32)
+        if self.normalize:
+            self._scaled = np.ascontiguousarray(self.matrix / self.scale)
+        else:
+            # Pas de copie : une matrice memmap reste partagée
+            self._scaled = self.matrix
+
+        self._tree = None
+        self._owner_rows = None
+        self._prefilter = None
+        self.ann = None
+        if self.backend == "kdtree" and len(self.matrix) > 0:
+            try:
+                from scipy.spatial import cKDTree
+                self._tree = cKDTree(self._scaled)
+            except ImportError:
+                self._tree = None
+        elif self.backend == "ivf" and len(self.matrix) > 0:
+            if ann is not None and 0 < added < len(self.matrix):
+                ann.rescale(old_scale / self.scale, self._scaled[:-added])
+                ann.add(self._scaled[-added:])
+                if not ann.needs_retrain():
+                    self.ann = ann
+            if self.ann is None:
+                self.ann = IVFIndex(**self.ann_options).build(self._scaled)
+
+    def retrain_ann(self):
+        """Relance le k-means de l'index IVF sur toute la galerie."""
+        if self.backend == "ivf" and len(self.matrix) > 0:
+            self.ann = IVFIndex(**self.ann_options).build(self._scaled)
+
+    def save_ann(self, path):
+        """Enregistre l'index IVF (évite le k-means au prochain chargement)."""
+        self.ann.save(path)
+
+    def load_ann(self, path):
+        """Remplace l'index IVF par celui enregistré dans `path`."""
+        self.ann = IVFIndex.load(path, self._scaled)
+        self.ann.nprobe = self.ann_options.get("nprobe", self.ann.nprobe)
+
+    # ---------- Liste de compatibilité ----------
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __getitem__(self, i):
+        return self.entries[i]
+
+    # ---------- Identités ----------
+
+    def owner_rows(self, owner):
+        """Indices des échantillons d'un propriétaire (tableau vide si inconnu)."""
+        if self._owner_rows is None:
+            rows = {}
+            for i, entry in enumerate(self.entries):
+                rows.setdefault(entry.get("owner"), []).append(i)
+            self._owner_rows = {k: np.array(v, dtype=np.intp) for k, v in rows.items()}
+        return self._owner_rows.get(owner, np.empty(0, dtype=np.intp))
+
+    def owners(self):
+        self.owner_rows(None)
+        return sorted(k for k in self._owner_rows if k is not None)
+
+    def size_prefilter(self):
+        """SizePrefilter de cet index, construit au premier appel."""
+        if self._prefilter is None:
+            self._prefilter = SizePrefilter(self)
+        return self._prefilter
+
+    def candidates(self, features, owner=None, prefilter=False):
+        """
+        Lignes à comparer pour une requête : celles du propriétaire et/ou
+        celles retenues par le préfiltre. None = toute la galerie.
+        Si le préfiltre ne garde rien, on ne l'applique pas (aucun rejet
+        sur la seule forme de la boîte).
+        """
+        rows = self.owner_rows(owner) if owner is not None else None
+        if prefilter and len(self):
+            kept = self.size_prefilter().candidates(features)
+            if rows is not None:
+                kept = np.intersect1d(kept, rows, assume_unique=True)
+            if len(kept):
+                rows = kept
+        return rows
+
+    # ---------- Requêtes ----------
+
+    def _prepare(self, queries):
+        if isinstance(queries, dict) or (
+            isinstance(queries, list) and queries and isinstance(queries[0], dict)
+        ):
+            queries = self.vectorize(queries)
+        q = np.asarray(queries, dtype=np.float32).reshape(-1, len(self.feature_keys))
+        return q / self.scale
+
+    def _distances(self, q, rows=None):
+        """Distances exactes (m, n) entre requêtes et références, par blocs."""
+        ref = self._scaled if rows is None else self._scaled[rows]
+        n, d = ref.shape
+        out = np.empty((len(q), n), dtype=np.float32)
+        step = max(1, _BLOCK_ELEMENTS // max(1, n * d))
+        for start in range(0, len(q), step):
+            diff = q[start:start + step, None, :] - ref[None, :, :]
+            np.sqrt(np.einsum("ijk,ijk->ij", diff, diff), out=out[start:start + step])
+        return out
+
+    def query(self, queries, k=1, candidates=None, exact=False):
+        """
+        k plus proches références pour chaque requête.
+        candidates : indices des lignes à considérer (None = toutes).
+        exact : ignore l'index approché (backend "ivf").
+        Retourne (distances, indices), deux tableaux de forme (m, k).
+        """
+        q = self._prepare(queries)
+        rows = None if candidates is None else np.asarray(candidates, dtype=np.intp)
+        k = min(k, len(self) if rows is None else len(rows))
+        if k == 0:
+            empty = np.empty((len(q), 0))
+            return empty.astype(np.float32), empty.astype(np.intp)
+
+        if self._tree is not None and rows is None:
+            dist, idx = self._tree.query(q, k=k)
+            return (np.asarray(dist, dtype=np.float32).reshape(len(q), k),
+                    np.asarray(idx, dtype=np.intp).reshape(len(q), k))
+
+        if self.ann is not None and rows is None and not exact:
+            dist, idx = self.ann.search(q, k)
+            if (idx >= 0).all():
+                return dist, idx
+            # Moins de k candidats dans les listes parcourues : repli exact
+
+        dist = self._distances(q, rows)
+        if k < dist.shape[1]:
+            idx = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        else:
+            idx = np.broadcast_to(np.arange(dist.shape[1]), dist.shape).copy()
+        part = np.take_along_axis(dist, idx, axis=1)
+        order = np.argsort(part, axis=1, kind="stable")
+        idx = np.take_along_axis(idx, order, axis=1)
+        dist = np.take_along_axis(dist, idx, axis=1)
+        return dist, (idx if rows is None else rows[idx])
+
+    def radius_query(self, query, radius):
+        """Toutes les références à distance <= radius, triées (distances, indices)."""
+        q = self._prepare(query)[:1]
+        if len(self) == 0:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.intp)
+        if self._tree is not None:
+            # L'arbre ne renvoie que les voisins : distances calculées sur eux seuls
+            idx = np.asarray(self._tree.query_ball_point(q[0], r=radius), dtype=np.intp)
+            dist = self._distances(q, idx)[0]
+        else:
+            dist = self._distances(q)[0]
+            idx = np.flatnonzero(dist <= radius)
+            dist = dist[idx]
+        order = np.argsort(dist, kind="stable")
+        return dist[order], idx[order]
+
+
+class SizePrefilter:
+    """
+    Préfiltre grossier pour l'identification 1:N : chaque référence est
+    rangée dans une case (log2 du rapport largeur/hauteur, log2 de la taille
+    sqrt(largeur * hauteur)). Une requête n'est comparée qu'aux références
+    de sa case et des cases voisines (`reach`), ce qui évite le calcul de
+    distance sur toute la galerie quand le nombre d'utilisateurs grandit.
+    """
+
+    def __init__(self, index, aspect_step=0.25, size_step=0.25, reach=1):
+        self.aspect_step = aspect_step
+        self.size_step = size_step
+        self.reach = reach
+        self.feature_keys = index.feature_keys
+        w = np.asarray(index.matrix[:, index.feature_keys.index("width")])
+        h = np.asarray(index.matrix[:, index.feature_keys.index("height")])
+        keys = self._keys(w, h)
+        uniq, inverse = np.unique(keys, axis=0, return_inverse=True)
+        order = np.argsort(inverse.ravel(), kind="stable")
+        bounds = np.cumsum(np.bincount(inverse.ravel(), minlength=len(uniq)))[:-1]
+        self.buckets = {
+            (int(a), int(s)): rows
+            for (a, s), rows in zip(uniq, np.split(order, bounds))
+        }
+
+    def _keys(self, w, h):
+        w = np.maximum(np.asarray(w, dtype=np.float64), 1.0)
+        h = np.maximum(np.asarray(h, dtype=np.float64), 1.0)
+        aspect = np.floor(np.log2(w / h) / self.aspect_step)
+        size = np.floor(0.5 * np.log2(w * h) / self.size_step)
+        return np.stack([aspect, size], axis=-1).astype(np.int64).reshape(-1, 2)
+
+    def candidates(self, features):
+        """Indices (triés) des références des cases voisines de la requête."""
+        a, s = self._keys(features["width"], features["height"])[0]
+        r = range(-self.reach, self.reach + 1)
+        found = [self.buckets[(a + da, s + ds)] for da in r for ds in r
+                 if (a + da, s + ds) in self.buckets]
+        if not found:
+            return np.empty(0, dtype=np.intp)
+        return np.sort(np.concatenate(found))
+
+
+def as_index(references):
+    """
+    Accepte une liste de dictionnaires, un ReferenceIndex ou tout objet
+    exposant `snapshot()` (ex. reference_sync.LiveReferenceIndex).
+    """
+    if isinstance(references, ReferenceIndex):
+        return references
+    if hasattr(references, "snapshot"):
+        return references.snapshot()
+    return ReferenceIndex.from_references(references)
+
+
+# -------- API historique --------
+
+def reference_entry(path, name=None, owner=None):
+    """
+    Lit une image de référence : entrée {"name", "features"} plus la taille,
+    la date de modification et l'empreinte SHA-256 du fichier.
+    owner : propriétaire de la signature (identification 1:N), optionnel.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    st = os.stat(path)
+    image = load_image(data)
+    if image is None:
+        raise ValueError(f"Image de référence illisible : {path}")
+    features = extract_basic_features(image)
+    # advanced = extract_advanced_features(image)  # vecteur float32 (optionnel)
+    entry = {
+        "name": name or os.path.basename(path),
+        "path": path,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "features": features,
+    }
+    if owner is not None:
+        entry["owner"] = owner
+    return entry
+
+
+def list_reference_files(folder=REF_FOLDER):
+    return [
+        filename for filename in sorted(os.listdir(folder))
+        if filename.endswith(IMAGE_EXTENSIONS)
+    ]
+
+
+def build_store(store_path, folder=REF_FOLDER):
+    """Extrait les features de toutes les références et écrit un FeatureStore."""
+    entries = [reference_entry(os.path.join(folder, f), f) for f in list_reference_files(folder)]
+    index = ReferenceIndex.from_references(entries)
+    return FeatureStore.write(store_path, index.feature_keys, entries, index.matrix)
+
+
+def load_references(store=None, **index_kwargs):
+    """
+    Charge toutes les images de référence et extrait leurs features.
+    store : chemin d'un FeatureStore ; s'il existe il est ouvert directement
+    (aucune image relue), sinon il est construit à partir de REF_FOLDER.
+    """
+    if store is not None:
+        if not FeatureStore.exists(store):
+            build_store(store)
+        return ReferenceIndex.from_store(FeatureStore(store), **index_kwargs)
+
+    # Les entrées gardent taille / date / empreinte : reference_sync.py
+    # s'en sert pour ne réextraire que les fichiers modifiés
+    references = [
+        reference_entry(os.path.join(REF_FOLDER, filename), filename)
+        for filename in list_reference_files()
+    ]
+    return ReferenceIndex.from_references(references, **index_kwargs)
 
 def compare_features(ref_features, input_features):
     """Calcule la distance Euclidienne entre features"""
@@ -32,24 +402,105 @@ def compare_features(ref_features, input_features):
     return np.sqrt(distance)
 
 def is_match(distance, threshold=1000):
-    """Retourne True si distance < threshold"""
-    return distance < threshold
+    """Retourne True si distance <= threshold (règle commune à verify_signature)"""
+    return distance <= threshold
+
+def _input_features(input_image):
+    if isinstance(input_image, dict):
+        return input_image  # features déjà extraites
+    if not isinstance(input_image, np.ndarray):
+        # chemin ou octets encodés : décodés une seule fois ici
+        source, input_image = input_image, load_image(input_image)
+        if input_image is None:
+            raise ValueError(f"Image illisible : {source if isinstance(source, str) else '<octets>'}")
+    return extract_basic_features(input_image)
 
-def find_best_match(input_image, references, threshold=1000):
-    """Compare input_image avec toutes les références et retourne la meilleure correspondance"""
-    input_features = extract_basic_features(input_image)
-    best_match = None
-    min_distance = float('inf')
 
-    for ref in references:
-        dist = compare_features(ref["features"], input_features)
-        if dist < min_distance:
-            min_distance = dist
-            best_match = ref
+def find_best_match(input_image, references, threshold=1000, owner=None, prefilter=False):
+    """
+    Compare input_image avec toutes les références et retourne la meilleure correspondance.
+    input_image : image, chemin, octets ou dictionnaire de features.
+    owner : ne compare qu'aux échantillons de ce propriétaire (vérification 1:1).
+    prefilter : élague d'abord les candidats par cases de taille (SizePrefilter).
+    """
+    input_features = _input_features(input_image)
+    index = as_index(references)
+    rows = index.candidates(input_features, owner, prefilter)
+    if len(index) == 0 or (rows is not None and len(rows) == 0):
+        return None, float('inf'), False
+
+    dist, idx = index.query(input_features, k=1, candidates=rows)
+    min_distance = float(dist[0, 0])
+    best_match = index[int(idx[0, 0])]
 
     match = is_match(min_distance, threshold)
     return best_match, min_distance, match
 
+
+def find_best_matches(inputs, references, threshold=1000, owner=None):
+    """
+    Version par lot de find_best_match : toutes les entrées sont comparées
+    en une seule requête vectorisée. Retourne [(entrée, distance, match)].
+    """
+    features = [_input_features(x) for x in inputs]
+    index = as_index(references)
+    if not features:
+        return []
+    rows = index.candidates(features[0], owner)
+    if len(index) == 0 or (rows is not None and len(rows) == 0):
+        return [(None, float('inf'), False)] * len(features)
+
+    dist, idx = index.query(features, k=1, candidates=rows)
+    return [
+        (index[int(i)], float(d), is_match(float(d), threshold))
+        for d, i in zip(dist[:, 0], idx[:, 0])
+    ]
+
+
+def identify(input_image, references, k=3, threshold=1000, prefilter=True):
+    """
+    Identification 1:N : les `k` propriétaires les plus proches, chacun avec
+    la distance de son meilleur échantillon.
+    Retourne [{"owner", "distance", "match", "entry"}] trié par distance.
+    """
+    return identify_many([input_image], references, k, threshold, prefilter)[0]
+
+
+def identify_many(inputs, references, k=3, threshold=1000, prefilter=True):
+    """
+    identify() pour plusieurs entrées en une seule requête vectorisée ; avec
+    le préfiltre, les candidats sont l'union de ceux de chaque entrée.
+    """
+    features = [_input_features(x) for x in inputs]
+    index = as_index(references)
+    if not features or len(index) == 0:
+        return [[] for _ in features]
+
+    rows = [index.candidates(f, prefilter=prefilter) for f in features]
+    rows = None if any(r is None for r in rows) else np.unique(np.concatenate(rows))
+    n = len(index) if rows is None else len(rows)
+    if n == 0:
+        return [[] for _ in features]
+
+    # Tous les candidats restants sont triés : un propriétaire peut avoir
+    # beaucoup d'échantillons avant le suivant
+    dist, idx = index.query(features, k=n, candidates=rows, exact=True)
+    rankings = []
+    for dist_row, idx_row in zip(dist, idx):
+        ranking, seen = [], set()
+        for d, i in zip(dist_row, idx_row):
+            entry = index[int(i)]
+            owner = entry.get("owner", entry["name"])
+            if owner in seen:
+                continue
+            seen.add(owner)
+            ranking.append({"owner": owner, "distance": float(d),
+                            "match": is_match(float(d), threshold), "entry": entry})
+            if len(ranking) == k:
+                break
+        rankings.append(ranking)
+    return rankings
+
 # --- TEST ---
 if __name__ == "__main__":
     refs = load_references()
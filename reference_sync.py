@@ -0,0 +1,172 @@
+# reference_sync.py
+"""
+Synchronisation incrémentale du dossier de références.
+
+Au lieu de tout reconstruire avec load_references(), sync_references()
+compare chaque fichier à l'entrée déjà indexée :
+- taille et date de modification identiques -> fichier inchangé ;
+- sinon l'empreinte SHA-256 tranche (un simple `touch` ne coûte qu'une lecture) ;
+- seuls les fichiers ajoutés ou modifiés sont réextraits, en parallèle ;
+- les fichiers supprimés sortent de l'index.
+
+Le nouvel index est construit à côté de l'ancien puis publié d'un coup dans
+un LiveReferenceIndex : un find_best_match() en cours garde son instantané,
+aucun lecteur ne voit de galerie à moitié construite.
+
+    live = LiveReferenceIndex(load_references())
+    report = sync_references(live)
+    find_best_match("bb.jpg", live)
+"""
+import hashlib
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from feature_store import FeatureStore
+from reference_db import REF_FOLDER, ReferenceIndex, list_reference_files, reference_entry
+
+
+class LiveReferenceIndex:
+    """
+    Référence partagée vers l'index courant. Les lecteurs prennent un
+    instantané (snapshot) ; swap() remplace l'index en une affectation.
+    """
+
+    def __init__(self, index=None):
+        self._index = index if index is not None else ReferenceIndex()
+        self._sync_lock = threading.Lock()
+        self.version = 0
+
+    def snapshot(self):
+        return self._index
+
+    def swap(self, index):
+        self._index = index
+        self.version += 1
+
+    def __len__(self):
+        return len(self._index)
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _extract(path, name):
+    # Fonction de module : doit être sérialisable pour le pool de processus
+    try:
+        return reference_entry(path, name), None
+    except Exception as e:
+        return None, str(e)
+
+
+def detect_changes(index, folder=REF_FOLDER):
+    """
+    Compare le dossier à l'index.
+    Retourne (unchanged, touched, to_extract, removed) :
+    - unchanged : [(position dans l'index, entrée éventuellement mise à jour)] ;
+    - touched : noms dont seule la date a changé (contenu identique) ;
+    - to_extract : [(chemin, nom, "added" | "modified")] ;
+    - removed : noms présents dans l'index mais plus sur le disque.
+    """
+    known = {entry["name"]: i for i, entry in enumerate(index)}
+    unchanged, touched, to_extract = [], [], []
+    for name in list_reference_files(folder):
+        path = os.path.join(folder, name)
+        i = known.pop(name, None)
+        if i is None:
+            to_extract.append((path, name, "added"))
+            continue
+        entry = index[i]
+        st = os.stat(path)
+        if entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns:
+            unchanged.append((i, entry))
+        elif entry.get("sha256") and entry.get("size") == st.st_size and _sha256(path) == entry["sha256"]:
+            # Contenu identique (copie, touch) : seule la date change
+            unchanged.append((i, dict(entry, path=path, mtime_ns=st.st_mtime_ns)))
+            touched.append(name)
+        else:
+            to_extract.append((path, name, "modified"))
+    return unchanged, touched, to_extract, sorted(known)
+
+
+def sync_references(live, folder=REF_FOLDER, workers=None, store=None):
+    """
+    Met à jour `live` (LiveReferenceIndex) depuis `folder`.
+    workers : processus d'extraction (None = nombre de CPU, 1 = sur place).
+    store : chemin d'un FeatureStore à tenir à jour (ajout simple si rien
+    n'a été modifié ni supprimé, réécriture complète sinon).
+    Retourne un rapport : added, modified, removed, touched, errors,
+    unchanged, seconds.
+    """
+    t0 = time.perf_counter()
+    # Une seule synchronisation à la fois ; les lecteurs ne sont jamais bloqués
+    with live._sync_lock:
+        old = live.snapshot()
+        unchanged, touched, to_extract, removed = detect_changes(old, folder)
+
+        jobs = [(path, name) for path, name, _ in to_extract]
+        if len(jobs) > 1 and workers != 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_extract, *zip(*jobs)))
+        else:
+            results = [_extract(path, name) for path, name in jobs]
+
+        report = {"added": [], "modified": [], "removed": removed, "touched": touched,
+                  "errors": {}, "unchanged": len(unchanged)}
+        fresh = []
+        for (path, name, kind), (entry, error) in zip(to_extract, results):
+            if error is not None:
+                report["errors"][name] = error
+                print(f"Erreur : référence ignorée ({name}) : {error}", file=sys.stderr)
+                continue
+            fresh.append(entry)
+            report[kind].append(name)
+
+        index = old
+        if fresh or touched or len(unchanged) != len(old):
+            # Les lignes inchangées sont reprises telles quelles dans la matrice
+            keep = np.array([i for i, _ in unchanged], dtype=np.intp)
+            matrix = np.vstack([
+                np.asarray(old.matrix[keep], dtype=np.float32),
+                old.vectorize([e["features"] for e in fresh]),
+            ])
+            entries = [e for _, e in unchanged] + fresh
+            index = ReferenceIndex.from_matrix(
+                np.ascontiguousarray(matrix), entries, old.feature_keys,
+                backend=old.backend, normalize=old.normalize, ann_options=old.ann_options,
+            )
+            live.swap(index)
+
+        if store is not None:
+            if not FeatureStore.exists(store):
+                FeatureStore.write(store, index.feature_keys, list(index), index.matrix)
+            elif index is not old:
+                current = FeatureStore(store)
+                if not touched and len(current) == len(old) == len(unchanged):
+                    current.append(fresh, index.matrix[len(unchanged):])
+                else:
+                    FeatureStore.write(store, index.feature_keys, list(index), index.matrix)
+
+    report["seconds"] = time.perf_counter() - t0
+    return report
+
+
+# --- TEST ---
+if __name__ == "__main__":
+    from reference_db import find_best_match, load_references
+
+    live = LiveReferenceIndex(load_references())
+    report = sync_references(live)
+    print(f"{len(live)} références ; ajoutées {report['added']}, modifiées {report['modified']}, "
+          f"supprimées {report['removed']} ({1000 * report['seconds']:.1f} ms)")
+    best, distance, match = find_best_match("bb.jpg", live)
+    print(f"Meilleure correspondance: {best['name']} ({distance:.2f})")
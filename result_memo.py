@@ -0,0 +1,274 @@
+# result_memo.py
+"""
+Mémoïsation des résultats de vérification pour les soumissions répétées
+(nouvel envoi après une erreur réseau, double téléversement, audit).
+
+La clé combine :
+- une empreinte rapide (BLAKE2b) du contenu reçu : octets du fichier ou
+  du téléversement, pixels d'un tableau déjà décodé ;
+- l'identifiant des références : empreinte de leur contenu (voir
+  reference_cache), pas leur chemin ;
+- le seuil, le propriétaire, PIPELINE_VERSION et la résolution de travail.
+Une image identique renvoyée avec les mêmes réglages ne repasse donc pas
+dans le pipeline ; si une référence ou le pipeline change, l'ancienne
+entrée n'est plus jamais relue.
+
+Seules les décisions (correspondance ou rejet) sont mémorisées : un échec
+(image illisible, trop petite) est recalculé au prochain envoi.
+
+Mémoire bornée : LRU (OrderedDict) de `max_entries` résultats, chacun
+valable `ttl_s` secondes. Niveau disque optionnel (un petit JSON par clé)
+qui survit aux redémarrages, lu et écrit hors du verrou ; il est balayé
+toutes les `sweep_every` écritures : fichiers expirés supprimés, puis les
+plus anciens au-delà de `max_disk_entries`.
+
+    memo = ResultMemo(max_entries=4096, ttl_s=3600, disk_dir="cache/results")
+    verify_signature("scan.png", "ref.png", memo=memo)
+"""
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from preprocessing import PIPELINE_VERSION, resolution_params
+from reference_cache import reference_id
+
+
+def input_hash(source):
+    """Empreinte BLAKE2b (128 bits) d'un chemin, d'octets ou d'un tableau."""
+    h = hashlib.blake2b(digest_size=16)
+    if isinstance(source, np.ndarray):
+        h.update(f"{source.dtype}{source.shape}".encode("ascii"))
+        h.update(np.ascontiguousarray(source).data)
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        h.update(source)
+    else:
+        with open(source, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def memo_key(source, reference, threshold, **extra):
+    """
+    Clé de mémoïsation. reference : une référence ou une liste d'échantillons
+    (ordre indifférent). extra : autres paramètres du résultat (ex. owner).
+    Lève OSError si un fichier est introuvable (pas de mémoïsation).
+    """
+    samples = reference if isinstance(reference, (list, tuple)) else [reference]
+    refs = sorted(reference_id(ref) for ref in samples)
+    payload = json.dumps(
+        {
+            "input": input_hash(source),
+            "references": refs,
+            "threshold": float(threshold),
+            "pipeline": PIPELINE_VERSION,
+            "resolution": resolution_params(),
+            "extra": extra,
+        },
+        sort_keys=True,
+    )
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class ResultMemo:
+    """
+    max_entries : résultats gardés en mémoire (le moins récemment utilisé sort).
+    ttl_s : durée de validité d'un résultat (None = illimitée).
+    disk_dir : dossier du niveau disque (None = mémoire seulement).
+    max_disk_entries : fichiers gardés sur disque (None = 16 x max_entries).
+    sweep_every : écritures disque entre deux balayages du dossier.
+    """
+
+    def __init__(self, max_entries=1024, ttl_s=3600.0, disk_dir=None, max_disk_entries=None,
+                 sweep_every=256):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries or 16 * max_entries
+        self.sweep_every = sweep_every
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        self.disk_removed = 0
+        self._entries = OrderedDict()  # clé -> (date d'expiration time.time(), valeur)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._sweeping = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _expiry(self):
+        return time.time() + self.ttl_s if self.ttl_s else float("inf")
+
+    # ---------- Disque ----------
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + ".json")
+
+    def _load_from_disk(self, key):
+        """(expiration, valeur), "expired" si le fichier a expiré, ou None."""
+        path = self._disk_path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            expires, value = data["expires"], data["value"]
+            expired = expires is not None and expires < time.time()
+        except OSError:
+            return None
+        except (ValueError, KeyError, TypeError):
+            # JSON illisible ou d'une autre forme : fichier écarté, compté en échec
+            self._remove(path)
+            return None
+        if expired:
+            self._remove(path)
+            return "expired"
+        return (expires if expires is not None else float("inf"), value)
+
+    def _save_to_disk(self, key, expires, value):
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            # Fichier temporaire propre à l'écrivain, puis remplacement
+            # atomique : un lecteur ne voit jamais un fichier partiel
+            fd, tmp = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"expires": None if expires == float("inf") else expires,
+                           "value": value}, f, ensure_ascii=False)
+            os.replace(tmp, self._disk_path(key))
+        except OSError as e:
+            print(f"Erreur : résultat non mémorisé sur disque ({e})", file=sys.stderr)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def sweep_disk(self):
+        """
+        Supprime les fichiers expirés (plus vieux que ttl_s), puis les plus
+        anciens au-delà de max_disk_entries. Retourne le nombre supprimé.
+        """
+        if not self.disk_dir or not os.path.isdir(self.disk_dir):
+            return 0
+        files = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith(".json"):
+                try:
+                    files.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass
+        files.sort()
+        now = time.time()
+        removed = 0
+        for i, (mtime, path) in enumerate(files):
+            too_old = self.ttl_s and mtime + self.ttl_s < now
+            if too_old or len(files) - i > self.max_disk_entries:
+                removed += self._remove(path)
+            else:
+                break
+        with self._lock:
+            self.disk_removed += removed
+        return removed
+
+    # ---------- API ----------
+
+    def get(self, key):
+        """Résultat mémorisé (valeur JSON) ou None."""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                if item[0] >= time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return item[1]
+                # Même date d'expiration sur disque : inutile d'y chercher
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            if not self.disk_dir:
+                self.misses += 1
+                return None
+
+        # Lecture disque hors du verrou : les autres requêtes ne l'attendent pas
+        item = self._load_from_disk(key)
+        with self._lock:
+            if item is None or item == "expired":
+                if item == "expired":
+                    self.expired += 1
+                self.misses += 1
+                return None
+            self._remember(key, item)
+            self.hits += 1
+            self.disk_hits += 1
+            return item[1]
+
+    def put(self, key, value):
+        """Mémorise `value` (sérialisable en JSON pour le niveau disque)."""
+        expires = self._expiry()
+        with self._lock:
+            self._remember(key, (expires, value))
+            if not self.disk_dir:
+                return
+            self._writes += 1
+            sweep = self._writes % self.sweep_every == 0 and not self._sweeping
+            self._sweeping = self._sweeping or sweep
+        self._save_to_disk(key, expires, value)
+        if sweep:
+            try:
+                self.sweep_disk()
+            finally:
+                self._sweeping = False
+
+    def _remember(self, key, item):
+        self._entries[key] = item
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self, disk=False):
+        """Vide la mémoire (et le dossier disque si disk=True)."""
+        with self._lock:
+            self._entries.clear()
+        if disk and self.disk_dir and os.path.isdir(self.disk_dir):
+            for name in os.listdir(self.disk_dir):
+                if name.endswith(".json"):
+                    self._remove(os.path.join(self.disk_dir, name))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "disk_removed": self.disk_removed,
+        }
+
+
+# --- TEST ---
+if __name__ == "__main__":
+    from verification import verify_signature
+
+    memo = ResultMemo(max_entries=8, ttl_s=60)
+    for label in ("premier envoi", "renvoi"):
+        t0 = time.perf_counter()
+        ok, msg = verify_signature("image_test.png", "signature_selsabil.png", memo=memo)
+        print(f"{label}: {1000 * (time.perf_counter() - t0):.2f} ms -> {msg}")
+    print(memo.stats())
@@ -0,0 +1,414 @@
+# service.py
+"""
+Service HTTP local de vérification (bibliothèque standard uniquement).
+
+    python service.py --port 8080 --workers 4
+
+Points d'entrée :
+- POST /verify    image brute dans le corps (ou JSON {"image": base64, ...}),
+                  paramètres owner=..., threshold=... (1:1 contre les
+                  échantillons enrôlés de `owner`), reference=nom d'un
+                  de ces échantillons pour ne comparer qu'à lui (aucun
+                  autre fichier du serveur n'est accessible) ;
+- POST /identify  même corps, paramètre k=... : propriétaires les plus proches ;
+- POST /reload    recharge la galerie enrôlée (remplacement atomique) ;
+- GET  /health    état du service (file, workers, galerie) ;
+- GET  /metrics   latences et compteurs au format Prometheus ;
+- GET  /stats     les mêmes données en JSON.
+
+Fonctionnement : chaque requête devient un travail déposé dans une file
+bornée (503 si elle est pleine). Un pool de workers fait le prétraitement
+(partie coûteuse, OpenCV relâche le GIL) ; les features prêtes sont
+regroupées par un thread de lots pendant quelques millisecondes et
+comparées à la galerie en un seul appel vectorisé
+(find_best_matches / identify_many) pour tout le lot. Un corps de requête
+au-delà de --max-body-mb est refusé (413) sans être lu.
+"""
+import base64
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from enrollment import ENROLL_FOLDER, check_owner, enrolled_samples, load_gallery
+from features import extract_features
+from metrics import enable_metrics, metrics
+from preprocessing import preprocess_signature
+from reference_db import find_best_matches, identify_many
+from verification import (
+    DEFAULT_OWNER, ERROR_PREPROCESS, ERROR_TOO_SMALL, is_error_message, verify_signature,
+)
+
+# Code HTTP des échecs de vérification (mêmes codes pour les deux routes 1:1)
+ERROR_STATUS = {ERROR_PREPROCESS: 400, ERROR_TOO_SMALL: 422}
+
+
+class ServiceError(Exception):
+    """Erreur renvoyée au client avec un code HTTP."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Job:
+    __slots__ = ("kind", "image", "params", "features", "result", "error", "done")
+
+    def __init__(self, kind, image, params):
+        self.kind = kind
+        self.image = image
+        self.params = params
+        self.features = None
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def finish(self, result=None, error=None):
+        self.result, self.error = result, error
+        self.done.set()
+
+
+class VerificationService:
+    """
+    workers : threads de prétraitement.
+    max_queue : travaux en attente au-delà desquels les requêtes sont refusées.
+    max_batch, batch_window_ms : taille max d'un lot et attente max pour le remplir.
+    memo : ResultMemo des vérifications 1:1 contre un échantillon désigné
+    (renvois d'une même image servis sans prétraitement).
+    """
+
+    def __init__(self, gallery=None, folder=ENROLL_FOLDER, workers=4, max_queue=64,
+                 max_batch=32, batch_window_ms=5.0, timeout_s=30.0, memo=None):
+        from reference_sync import LiveReferenceIndex
+
+        self.folder = folder
+        self.memo = memo
+        self.live = LiveReferenceIndex(gallery if gallery is not None else load_gallery(folder))
+        self.jobs = queue.Queue(maxsize=max_queue)
+        self.ready = queue.Queue()
+        self.workers = workers
+        self.max_batch = max_batch
+        self.batch_window = batch_window_ms / 1000.0
+        self.timeout_s = timeout_s
+        self.batches = 0
+        self.batched_jobs = 0
+        self.started = time.time()
+
+        self._threads = [
+            threading.Thread(target=self._work, name=f"verify-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        self._threads.append(threading.Thread(target=self._batch_loop, name="verify-batcher",
+                                              daemon=True))
+        for t in self._threads:
+            t.start()
+
+    # ---------- Soumission ----------
+
+    def submit(self, kind, image, **params):
+        """Dépose un travail et attend son résultat (ServiceError sinon)."""
+        job = Job(kind, image, params)
+        try:
+            self.jobs.put_nowait(job)
+        except queue.Full:
+            metrics.inc("rejected_overload")
+            raise ServiceError(503, "Service saturé, réessayer plus tard.")
+        if not job.done.wait(self.timeout_s):
+            metrics.inc("timeouts")
+            raise ServiceError(504, "Délai de traitement dépassé.")
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def reload(self):
+        self.live.swap(load_gallery(self.folder))
+        return len(self.live)
+
+    def reference_path(self, owner, name):
+        """Chemin de l'échantillon enrôlé `name` de `owner` (ServiceError 404 sinon)."""
+        for path in enrolled_samples(owner, self.folder):
+            if os.path.basename(path) == name:
+                return path
+        raise ServiceError(404, f"Échantillon {name!r} introuvable pour {owner}.")
+
+    # ---------- Prétraitement (pool de workers) ----------
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                if job.kind == "verify" and job.params.get("reference"):
+                    # 1:1 contre un seul échantillon : pas de galerie, pas de lot
+                    match, message = verify_signature(
+                        job.image, job.params["reference"], job.params["threshold"],
+                        owner=job.params["owner"], memo=self.memo,
+                    )
+                    if is_error_message(message):
+                        raise ServiceError(ERROR_STATUS.get(message, 500), message)
+                    job.finish({"match": match, "owner": job.params["owner"],
+                                "message": message})
+                    continue
+                with metrics.stage("preprocess"):
+                    roi, w, h = preprocess_signature(job.image)
+                if roi is None:
+                    raise ServiceError(ERROR_STATUS[ERROR_PREPROCESS], ERROR_PREPROCESS)
+                if w < 50 or h < 50:
+                    raise ServiceError(ERROR_STATUS[ERROR_TOO_SMALL], ERROR_TOO_SMALL)
+                job.features = extract_features(roi, w, h)
+                self.ready.put(job)
+            except ServiceError as e:
+                job.finish(error=e)
+            except Exception as e:
+                job.finish(error=ServiceError(500, f"Erreur interne : {e}"))
+
+    # ---------- Micro-lots ----------
+
+    def _batch_loop(self):
+        while True:
+            batch = [self.ready.get()]
+            deadline = time.perf_counter() + self.batch_window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.ready.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                for job in batch:
+                    if not job.done.is_set():
+                        job.finish(error=ServiceError(500, f"Erreur interne : {e}"))
+
+    def _run_batch(self, batch):
+        self.batches += 1
+        self.batched_jobs += len(batch)
+        metrics.inc("batches")
+        metrics.inc("batched_requests", len(batch))
+        index = self.live.snapshot()  # toute la galerie du lot vient du même instantané
+
+        groups = defaultdict(list)
+        for job in batch:
+            if job.kind == "verify":
+                groups[("verify", job.params["owner"], job.params["threshold"])].append(job)
+            else:
+                groups[("identify", job.params["k"], job.params["threshold"])].append(job)
+
+        with metrics.stage("match_batch"):
+            for key, jobs in groups.items():
+                features = [job.features for job in jobs]
+                if key[0] == "verify":
+                    _, owner, threshold = key
+                    if len(index.owner_rows(owner)) == 0:
+                        for job in jobs:
+                            job.finish(error=ServiceError(
+                                404, f"Aucun échantillon enrôlé pour {owner}."))
+                        continue
+                    for job, (entry, dist, match) in zip(
+                            jobs, find_best_matches(features, index, threshold, owner)):
+                        job.finish({
+                            "match": bool(match),
+                            "owner": owner,
+                            "distance": dist,
+                            "sample": entry["name"],
+                            "message": (f" C'EST LA SIGNATURE DE {owner.upper()} !"
+                                        if match else "Signature non reconnue."),
+                        })
+                else:
+                    _, k, threshold = key
+                    for job, ranking in zip(jobs, identify_many(features, index, k, threshold)):
+                        job.finish({"candidates": [
+                            {"owner": r["owner"], "distance": r["distance"],
+                             "match": bool(r["match"]), "sample": r["entry"]["name"]}
+                            for r in ranking
+                        ]})
+
+    # ---------- État ----------
+
+    def health(self):
+        return {
+            "status": "ok",
+            "uptime_s": round(time.time() - self.started, 1),
+            "queue": self.jobs.qsize(),
+            "queue_max": self.jobs.maxsize,
+            "workers": self.workers,
+            "gallery": len(self.live),
+            "owners": len(self.live.snapshot().owners()),
+        }
+
+    def stats(self):
+        data = metrics.snapshot()
+        data["batches"] = self.batches
+        data["mean_batch_size"] = self.batched_jobs / self.batches if self.batches else 0.0
+        if self.memo is not None:
+            data["memo"] = self.memo.stats()
+        return data
+
+
+# -------- HTTP --------
+
+class RequestHandler(BaseHTTPRequestHandler):
+    server_version = "SignatureService/1.0"
+
+    def log_message(self, fmt, *args):
+        pass  # les requêtes sont suivies par les métriques, pas par stderr
+
+    def _send(self, status, payload, content_type="application/json; charset=utf-8"):
+        body = payload if isinstance(payload, bytes) else \
+            json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_request(self):
+        """Image (octets) et paramètres : corps brut + query string, ou JSON."""
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True  # corps de taille inconnue : non lu
+            raise ServiceError(400, "Content-Length invalide.")
+        limit = self.server.max_body_bytes
+        if length > limit:
+            self.close_connection = True  # corps refusé sans être lu
+            raise ServiceError(413, f"Corps trop volumineux (max {limit} octets).")
+        body = self.rfile.read(length) if length else b""
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            try:
+                data = json.loads(body or b"{}")
+                image = base64.b64decode(data.pop("image", ""), validate=True)
+            except (ValueError, TypeError):
+                raise ServiceError(400, "JSON ou image base64 invalide.")
+            params.update({k: str(v) for k, v in data.items()})
+        else:
+            image = body
+        if not image:
+            raise ServiceError(400, "Image manquante.")
+        return image, params
+
+    def do_GET(self):
+        service = self.server.service
+        path = urlparse(self.path).path
+        if path == "/health":
+            self._send(200, service.health())
+        elif path == "/metrics":
+            self._send(200, metrics.to_prometheus().encode("utf-8"),
+                       "text/plain; version=0.0.4; charset=utf-8")
+        elif path == "/stats":
+            self._send(200, service.stats())
+        else:
+            self._send(404, {"error": "Point d'entrée inconnu."})
+
+    def do_POST(self):
+        service = self.server.service
+        path = urlparse(self.path).path
+        kind = path.strip("/")
+        try:
+            if kind == "reload":
+                self._send(200, {"gallery": service.reload()})
+                return
+            if kind not in ("verify", "identify"):
+                raise ServiceError(404, "Point d'entrée inconnu.")
+
+            image, params = self._read_request()
+            try:
+                threshold = float(params.get("threshold", 1000.0))
+                k = int(params.get("k", 3))
+            except ValueError:
+                raise ServiceError(400, "Paramètre numérique invalide.")
+            options = {"threshold": threshold}
+            if kind == "verify":
+                try:
+                    options["owner"] = check_owner(params.get("owner", DEFAULT_OWNER))
+                except ValueError as e:
+                    raise ServiceError(400, str(e))
+                if params.get("reference"):
+                    options["reference"] = service.reference_path(
+                        options["owner"], params["reference"])
+            else:
+                options["k"] = k
+
+            metrics.inc(f"http_{kind}")
+            t0 = time.perf_counter()
+            with metrics.stage(f"http_{kind}"):
+                result = service.submit(kind, image, **options)
+            result["latency_ms"] = round(1000 * (time.perf_counter() - t0), 3)
+            self._send(200, result)
+        except ServiceError as e:
+            metrics.inc(f"http_{e.status}")
+            self._send(e.status, {"error": str(e)})
+
+
+class SignatureHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # File d'attente TCP : la limite réelle est la file de travaux (503)
+    request_queue_size = 128
+    # Taille max d'un corps de requête (413 au-delà)
+    max_body_bytes = 20 << 20
+
+
+def make_server(host="127.0.0.1", port=8080, max_body_bytes=None, **service_kwargs):
+    """Serveur prêt à lancer (serve_forever) ; la vérification est dans server.service."""
+    enable_metrics()
+    server = SignatureHTTPServer((host, port), RequestHandler)
+    if max_body_bytes is not None:
+        server.max_body_bytes = max_body_bytes
+    server.service = VerificationService(**service_kwargs)
+    return server
+
+
+def main(argv=None):
+    import argparse
+
+    from result_memo import ResultMemo
+
+    parser = argparse.ArgumentParser(description="Service HTTP de vérification de signatures")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--folder", default=ENROLL_FOLDER, help="dossier des échantillons enrôlés")
+    parser.add_argument("-w", "--workers", type=int, default=4)
+    parser.add_argument("--max-queue", type=int, default=64)
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--batch-window-ms", type=float, default=5.0)
+    parser.add_argument("--max-body-mb", type=float, default=20.0,
+                        help="taille max d'un corps de requête (413 au-delà)")
+    parser.add_argument("--memo", type=int, default=0,
+                        help="résultats 1:1 mémorisés (0 = désactivé)")
+    parser.add_argument("--memo-ttl", type=float, default=3600.0, help="validité (s)")
+    parser.add_argument("--memo-dir", help="niveau disque de la mémoïsation")
+    parser.add_argument("--memo-disk-entries", type=int, default=None,
+                        help="fichiers gardés sur disque (défaut 16 x --memo)")
+    args = parser.parse_args(argv)
+
+    memo = (ResultMemo(args.memo, args.memo_ttl, args.memo_dir, args.memo_disk_entries)
+            if args.memo > 0 else None)
+
+    server = make_server(
+        args.host, args.port, max_body_bytes=int(args.max_body_mb * (1 << 20)),
+        folder=args.folder, workers=args.workers,
+        max_queue=args.max_queue, max_batch=args.max_batch,
+        batch_window_ms=args.batch_window_ms, memo=memo,
+    )
+    print(f"Service de vérification sur http://{args.host}:{args.port} "
+          f"({len(server.service.live)} échantillons enrôlés)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+# shm_pool.py
+"""
+Prétraitement sur un pool de processus, sans sérialiser les images.
+
+Avec un ProcessPoolExecutor classique, chaque image décodée est picklée
+vers le processus, puis la ROI revient picklée : pour une page à 600 DPI
+la copie coûte presque autant que le traitement. Ici :
+
+- le pool crée une fois pour toutes `slots` blocs multiprocessing.shared_memory ;
+  une image (tableau ou octets encodés) est copiée dans un bloc libre et le
+  processus la lit en place (vue NumPy sur le bloc, aucune sérialisation) ;
+- le bloc est rendu à la liste des blocs libres dès que le résultat arrive,
+  et réutilisé pour l'image suivante (pas de création / destruction par image) ;
+- le processus ne renvoie que le résultat compact : la ROI en bits
+  (np.packbits, 8 fois plus petite) et le dictionnaire de features ;
+- chaque processus fixe le nombre de threads OpenCV (1 par défaut) : N
+  processus x N threads OpenCV satureraient les cœurs.
+
+Les chemins de fichiers sont transmis tels quels (le processus lit le
+fichier lui-même), et une image trop grande pour un bloc est transmise
+par pickle (compteur `fallbacks`).
+
+    with SharedPreprocessPool(workers=4) as pool:
+        results = pool.map(images)
+        roi = unpack_roi(results[0])
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from features import extract_features
+from preprocessing import preprocess_pipeline
+
+# Taille d'un bloc par défaut : une page A4 couleur à 300 DPI (~26 Mo)
+SLOT_BYTES = 32 << 20
+
+
+def _attach(name):
+    """Ouvre un bloc existant sans le confier au resource_tracker (Python >= 3.13)."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+# -------- Côté processus --------
+
+_slots = {}  # nom du bloc -> SharedMemory, ouverts une fois par processus
+
+
+def _init_worker(names, cv_threads):
+    import cv2
+
+    cv2.setNumThreads(cv_threads)
+    for name in names:
+        _slots[name] = _attach(name)
+
+
+def _preprocess(payload, pipeline_kwargs):
+    """
+    payload : ("shm", nom, forme, dtype) | ("bytes", nom, taille) |
+    ("object", source). Retourne le résultat compact (voir SharedPreprocessPool).
+    """
+    t0 = time.perf_counter()
+    kind = payload[0]
+    if kind == "shm":
+        _, name, shape, dtype = payload
+        source = np.ndarray(shape, dtype=dtype, buffer=_slots[name].buf)
+    elif kind == "bytes":
+        _, name, size = payload
+        source = _slots[name].buf[:size]
+    else:
+        source = payload[1]
+
+    roi, w, h = preprocess_pipeline(source, **pipeline_kwargs)
+    del source  # libère la vue sur le bloc avant de le rendre
+    if roi is None:
+        return {"roi_bits": None, "roi_shape": (0, 0), "width": 0, "height": 0,
+                "features": None, "seconds": time.perf_counter() - t0}
+    return {
+        "roi_bits": np.packbits(roi == 0),  # bit à 1 = encre
+        "roi_shape": roi.shape,
+        "width": w,
+        "height": h,
+        "features": extract_features(roi, w, h),
+        "seconds": time.perf_counter() - t0,
+    }
+
+
+def unpack_roi(result):
+    """ROI uint8 (0 = encre, 255 = fond) d'un résultat du pool, ou None."""
+    if result["roi_bits"] is None:
+        return None
+    rows, cols = result["roi_shape"]
+    ink = np.unpackbits(result["roi_bits"], count=rows * cols).reshape(rows, cols)
+    return ((1 - ink) * 255).astype(np.uint8)
+
+
+# -------- Côté appelant --------
+
+class SharedPreprocessPool:
+    """
+    workers : processus (None = nombre de CPU).
+    slots : blocs de mémoire partagée (None = 2 par processus : un en
+    traitement, un en cours de remplissage).
+    slot_bytes : taille de chaque bloc.
+    cv_threads : threads OpenCV par processus.
+    pipeline_kwargs : options de preprocess_pipeline (debug=False par défaut,
+    le sink de debug du parent n'existe pas dans les processus).
+    """
+
+    def __init__(self, workers=None, slots=None, slot_bytes=SLOT_BYTES, cv_threads=1,
+                 **pipeline_kwargs):
+        self.workers = workers or os.cpu_count() or 1
+        self.slot_bytes = slot_bytes
+        self.pipeline_kwargs = {"debug": False, **pipeline_kwargs}
+        self.submitted = 0
+        self.transfers = 0
+        self.fallbacks = 0
+
+        self._blocks = [shared_memory.SharedMemory(create=True, size=slot_bytes)
+                        for _ in range(slots or 2 * self.workers)]
+        self._free = queue.Queue()
+        for block in self._blocks:
+            self._free.put(block.name)
+        self._lock = threading.Lock()
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=([b.name for b in self._blocks], cv_threads),
+        )
+        self._by_name = {b.name: b for b in self._blocks}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit(self, source):
+        """
+        Lance le prétraitement de `source` (tableau, octets encodés ou
+        chemin). Bloque tant qu'aucun bloc n'est libre. Retourne un Future
+        dont le résultat est {"roi_bits", "roi_shape", "width", "height",
+        "features", "seconds"}.
+        """
+        name = None
+        if isinstance(source, np.ndarray) and source.nbytes <= self.slot_bytes:
+            name = self._free.get()
+            block = self._by_name[name]
+            view = np.ndarray(source.shape, dtype=source.dtype, buffer=block.buf)
+            view[...] = source
+            del view
+            payload = ("shm", name, source.shape, source.dtype.str)
+        elif (isinstance(source, (bytes, bytearray, memoryview))
+              and len(source) <= self.slot_bytes):
+            name = self._free.get()
+            self._by_name[name].buf[:len(source)] = source
+            payload = ("bytes", name, len(source))
+        else:
+            payload = ("object", source)
+
+        with self._lock:
+            self.submitted += 1
+            if name is not None:
+                self.transfers += 1
+            elif not isinstance(source, (str, os.PathLike)):
+                self.fallbacks += 1
+
+        future = self.executor.submit(_preprocess, payload, self.pipeline_kwargs)
+        if name is not None:
+            future.add_done_callback(lambda _, n=name: self._free.put(n))
+        return future
+
+    def map(self, sources):
+        """Résultats dans l'ordre des sources (au plus `slots` images en vol)."""
+        return [future.result() for future in [self.submit(s) for s in sources]]
+
+    def stats(self):
+        return {"workers": self.workers, "slots": len(self._blocks),
+                "submitted": self.submitted, "transfers": self.transfers,
+                "fallbacks": self.fallbacks}
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+
+# --- TEST ---
+if __name__ == "__main__":
+    import argparse
+    import pickle
+
+    from synthetic_signatures import synthetic_signature
+
+    parser = argparse.ArgumentParser(description="Pool de prétraitement en mémoire partagée")
+    parser.add_argument("-n", type=int, default=32, help="nombre d'images")
+    parser.add_argument("--size", type=int, nargs=2, default=(2400, 1200))
+    parser.add_argument("-w", "--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    width, height = args.size
+    images = [synthetic_signature(width, height, strokes=4, thickness=5, seed=i)
+              for i in range(args.n)]
+
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(args.workers, initializer=_init_worker, initargs=([], 1)) as pool:
+        pickled = list(pool.map(_preprocess, [("object", img) for img in images],
+                                [{"debug": False}] * len(images)))
+    t_pickle = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with SharedPreprocessPool(args.workers) as pool:
+        shared = pool.map(images)
+        stats = pool.stats()
+    t_shared = time.perf_counter() - t0
+
+    assert [r["features"] for r in pickled] == [r["features"] for r in shared]
+    roi_bytes = sum(r["roi_shape"][0] * r["roi_shape"][1] for r in shared)
+    result_bytes = sum(len(pickle.dumps(r)) for r in shared)
+    print(f"{args.n} images {width}x{height} ({images[0].nbytes / 1e6:.1f} Mo chacune)")
+    print(f"  pickle : {t_pickle:.2f} s")
+    print(f"  mémoire partagée : {t_shared:.2f} s  {stats}")
+    print(f"  retour : {result_bytes / 1e3:.0f} Ko (ROI brutes : {roi_bytes / 1e3:.0f} Ko)")
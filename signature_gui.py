@@ -1,14 +1,25 @@
 import tkinter as tk
 from tkinter import messagebox
-from PIL import Image, ImageTk, ImageGrab
+import numpy as np
 import os
 
-from verification import verify_signature
+from verification import DEFAULT_OWNER, verify_signature
+from reference_cache import warm_up
+from enrollment import check_owner, enroll, enrolled_samples, identify, list_owners, load_gallery
+from gui_worker import BackgroundWorker
+from strokes import StrokeRecorder, rasterize_strokes
 
-# Image de référence (à adapter si besoin)
+# Référence historique de DEFAULT_OWNER, utilisée tant qu'aucun
+# échantillon n'est enrôlé pour cette personne
 REFERENCE_PATH = "signature_selsabil.png"   # ou "image_test.png"
 
 
+def event_time(event):
+    """Horodatage Tk de l'événement (ms), ou None s'il n'est pas fourni."""
+    t = getattr(event, "time", None)
+    return float(t) if isinstance(t, int) and t > 0 else None
+
+
 class SignatureApp:
     def __init__(self, root):
         self.root = root
@@ -29,10 +40,11 @@ class SignatureApp:
         )
         self.canvas.grid(row=0, column=0, padx=10, pady=10, columnspan=3)
 
-        # Gestion du dessin
+        # Gestion du dessin : les traits sont aussi enregistrés en vectoriel
         self.drawing = False
         self.last_x = None
         self.last_y = None
+        self.recorder = StrokeRecorder()
 
         self.bind_mouse_events()
 
@@ -46,6 +58,18 @@ class SignatureApp:
         self.btn_verify = tk.Button(btn_frame, text="Vérifier", command=self.on_verify)
         self.btn_verify.grid(row=0, column=1, padx=5)
 
+        self.btn_enroll = tk.Button(btn_frame, text="Enrôler", command=self.on_enroll)
+        self.btn_enroll.grid(row=0, column=2, padx=5)
+
+        self.btn_identify = tk.Button(btn_frame, text="Identifier", command=self.on_identify)
+        self.btn_identify.grid(row=0, column=3, padx=5)
+
+        # ----- Propriétaire (vérification 1:1 / enrôlement) -----
+        tk.Label(btn_frame, text="Personne :").grid(row=1, column=0, sticky="e", pady=5)
+        self.owner_var = tk.StringVar(value=DEFAULT_OWNER)
+        self.owner_entry = tk.Entry(btn_frame, textvariable=self.owner_var, width=20)
+        self.owner_entry.grid(row=1, column=1, columnspan=3, sticky="w", pady=5)
+
         # ----- Affichage image de référence -----
         self.ref_label = tk.Label(root, text="Signature de référence :")
         self.ref_label.grid(row=2, column=0, sticky="w", padx=10)
@@ -53,8 +77,27 @@ class SignatureApp:
         self.ref_canvas = tk.Label(root)
         self.ref_canvas.grid(row=2, column=1, sticky="w", padx=10)
 
+        # ----- Statut (traitements en arrière-plan) -----
+        self.status = tk.Label(root, text="", fg="gray")
+        self.status.grid(row=3, column=0, columnspan=3, sticky="w", padx=10, pady=(0, 10))
+
         self.load_reference_image()
 
+        # Vérification / identification hors du thread Tk
+        self.worker = BackgroundWorker(root)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.gallery = None
+
+        # Prétraitement des références une seule fois, au démarrage, en
+        # arrière-plan : le premier clic ne coûte pas plus que les suivants
+        self.set_status("Chargement des références…")
+        self.worker.submit(
+            warm_up, [REFERENCE_PATH] + [p for o in list_owners() for p in enrolled_samples(o)],
+            on_done=lambda _: self.set_status(""),
+            on_error=lambda e: self.set_status(f"Préchargement impossible : {e}"),
+            coalesce=False,
+        )
+
     # --------------------------- Dessin ---------------------------
 
     def bind_mouse_events(self):
@@ -63,8 +106,11 @@ class SignatureApp:
         self.canvas.bind("<ButtonRelease-1>", self.on_button_release)
 
     def on_button_press(self, event):
+        # Nouveau tracé : un résultat en attente ne correspond plus au dessin
+        self.cancel_pending()
         self.drawing = True
         self.last_x, self.last_y = event.x, event.y
+        self.recorder.begin(event.x, event.y, event_time(event))
 
     def on_paint(self, event):
         if not self.drawing:
@@ -80,18 +126,42 @@ class SignatureApp:
             capstyle=tk.ROUND,
             smooth=True
         )
+        self.recorder.add(x, y, event_time(event))
         self.last_x, self.last_y = x, y
 
     def on_button_release(self, event):
         self.drawing = False
         self.last_x, self.last_y = None, None
+        self.recorder.end()
 
     def clear_canvas(self):
+        self.cancel_pending()
         self.canvas.delete("all")
+        self.recorder.clear()
+
+    # --------------------------- Arrière-plan ---------------------------
+
+    def set_status(self, text):
+        self.status.config(text=text)
+
+    def cancel_pending(self):
+        if self.worker.busy:
+            self.set_status("")
+        self.worker.invalidate()
+
+    def show_error(self, error):
+        self.set_status("")
+        messagebox.showerror("Erreur", f"Traitement impossible : {error}")
+
+    def on_close(self):
+        self.worker.shutdown()
+        self.root.destroy()
 
     # --------------------------- Référence ---------------------------
 
     def load_reference_image(self):
+        from PIL import Image, ImageTk
+
         try:
             img = Image.open(REFERENCE_PATH)
             img = img.resize((200, 100))
@@ -102,40 +172,42 @@ class SignatureApp:
 
     # --------------------------- Sauvegarde / Validation ---------------------------
 
+    def grab_canvas_array(self):
+        """
+        Retourne le dessin en tableau NumPy (gris, fond blanc), redessiné à
+        partir des traits enregistrés : pas de capture d'écran, résultat
+        exact même si la fenêtre est masquée.
+        """
+        return rasterize_strokes(
+            self.recorder.all_strokes(), self.canvas_width, self.canvas_height,
+            thickness=self.pen_width,
+        )
+
     def save_canvas_image(self, path="temp_input.png"):
         """
         Capture le contenu du canvas et l'enregistre en PNG.
         """
-        self.canvas.update()
-
-        # Petite marge autour du canvas pour ne pas couper les traits
-        margin = 2
-        x = self.canvas.winfo_rootx() + margin
-        y = self.canvas.winfo_rooty() + margin
-        x1 = x + self.canvas_width - 2 * margin
-        y1 = y + self.canvas_height - 2 * margin
+        from PIL import Image
 
-        img = ImageGrab.grab(bbox=(x, y, x1, y1))
-        img = img.convert("L")  # gris (optionnel)
-        img.save(path)
+        Image.fromarray(self.grab_canvas_array()).save(path)
 
-    def count_black_pixels(self, img_path, threshold=220):
+    def count_black_pixels(self, image, threshold=220):
         """
-        Retourne le nombre de pixels "sombres" (noirs) dans l'image.
+        Retourne le nombre de pixels "sombres" (noirs) dans l'image
+        (tableau NumPy en niveaux de gris ou chemin de fichier).
         """
-        img = Image.open(img_path).convert("L")
-        # Pixels sombres = valeur < threshold
-        bw = img.point(lambda p: 255 if p > threshold else 0, "1")
-        black_pixels = bw.size[0] * bw.size[1] - sum(bw.getdata())
-        return black_pixels
+        if not isinstance(image, np.ndarray):
+            from PIL import Image
+            image = np.asarray(Image.open(image).convert("L"))
+        # Pixels sombres = valeur <= threshold
+        return int(np.count_nonzero(image <= threshold))
 
     def on_verify(self):
-        input_path = "temp_input.png"
-        self.save_canvas_image(input_path)
+        image = self.grab_canvas_array()
 
         # Vérifier que le dessin n'est pas vide
         try:
-            black_pixels = self.count_black_pixels(input_path)
+            black_pixels = self.count_black_pixels(image)
         except Exception:
             messagebox.showerror("Erreur", "Impossible d'analyser l'image dessinée.")
             return
@@ -152,16 +224,93 @@ class SignatureApp:
             )
             return
 
-        if not os.path.exists(REFERENCE_PATH):
+        owner = self.current_owner()
+        if owner is None:
+            return
+        samples = enrolled_samples(owner)
+        if not samples and owner == DEFAULT_OWNER:
+            samples = [REFERENCE_PATH]
+        if not samples or not all(os.path.exists(p) for p in samples):
             messagebox.showerror(
                 "Erreur",
-                f"Image de référence introuvable : {REFERENCE_PATH}"
+                f"Aucune référence trouvée pour {owner}."
             )
             return
 
-        match, msg = verify_signature(input_path, REFERENCE_PATH)
+        self.set_status("Vérification en cours…")
+        self.worker.submit(
+            verify_signature, image, samples, 1000.0, owner,
+            on_done=self.show_verification, on_error=self.show_error,
+        )
+
+    def show_verification(self, result):
+        match, msg = result
+        self.set_status("")
         messagebox.showinfo("Résultat de vérification", msg)
 
+    # --------------------------- Plusieurs personnes ---------------------------
+
+    def current_owner(self):
+        try:
+            return check_owner(self.owner_var.get().strip())
+        except ValueError:
+            messagebox.showerror("Erreur", "Nom de personne invalide.")
+            return None
+
+    def on_enroll(self):
+        """Ajoute le dessin courant aux échantillons de la personne saisie."""
+        owner = self.current_owner()
+        if owner is None:
+            return
+        image = self.grab_canvas_array()
+        if self.count_black_pixels(image) < 20:
+            messagebox.showwarning("Dessin insuffisant", "Dessine une signature avant d'enrôler.")
+            return
+        paths = enroll(owner, [image])
+        for path in paths:
+            # Traits horodatés à côté de l'image, pour de futures features
+            self.recorder.save(os.path.splitext(path)[0] + ".strokes.json")
+        self.gallery = None  # la galerie sera rechargée à la prochaine identification
+        self.worker.submit(warm_up, paths, coalesce=False)
+        messagebox.showinfo(
+            "Enrôlement",
+            f"Échantillon enregistré pour {owner} "
+            f"({len(enrolled_samples(owner))} au total)."
+        )
+        self.clear_canvas()
+
+    def on_identify(self):
+        """Identification 1:N parmi toutes les personnes enrôlées."""
+        self.set_status("Identification en cours…")
+        self.worker.submit(
+            self.identify_job, self.grab_canvas_array(), self.gallery,
+            on_done=self.show_identification, on_error=self.show_error,
+        )
+
+    @staticmethod
+    def identify_job(image, gallery):
+        # Thread de travail : (re)charge la galerie si besoin, puis identifie
+        if gallery is None:
+            gallery = load_gallery()
+        return gallery, (identify(image, gallery) if len(gallery) else None)
+
+    def show_identification(self, result):
+        self.gallery, results = result
+        self.set_status("")
+        if results is None:
+            messagebox.showerror("Erreur", "Aucune personne enrôlée.")
+            return
+        if not results:
+            messagebox.showerror("Erreur", "Impossible d'analyser l'image dessinée.")
+            return
+        lines = [
+            f"{r['owner']} : distance {r['distance']:.0f}" + ("  (correspondance)" if r["match"] else "")
+            for r in results
+        ]
+        if results[0]["match"]:
+            self.owner_var.set(results[0]["owner"])
+        messagebox.showinfo("Identification", "\n".join(lines))
+
 
 def main():
     root = tk.Tk()
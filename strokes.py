@@ -0,0 +1,128 @@
+# strokes.py
+"""
+Capture vectorielle de la signature dessinée dans l'interface.
+
+Les traits reçus par les événements souris sont enregistrés comme des
+listes de points horodatés (x, y, t en ms), puis dessinés directement dans
+un tableau NumPy avec cv2.polylines : pas de capture d'écran, image exacte
+même si la fenêtre est masquée ou sans affichage. Le minutage des traits
+(durée, levers de stylo, vitesse) reste disponible pour de futures features.
+"""
+import json
+import time
+
+import numpy as np
+
+
+class StrokeRecorder:
+    """Liste de traits ; chaque trait est un tableau float (n, 3) : x, y, t (ms)."""
+
+    def __init__(self):
+        self.strokes = []
+        self._current = None
+
+    @staticmethod
+    def _now():
+        return 1000.0 * time.perf_counter()
+
+    def begin(self, x, y, t=None):
+        self.end()
+        self._current = [(x, y, self._now() if t is None else t)]
+
+    def add(self, x, y, t=None):
+        if self._current is None:
+            self.begin(x, y, t)
+        else:
+            self._current.append((x, y, self._now() if t is None else t))
+
+    def end(self):
+        if self._current:
+            self.strokes.append(np.array(self._current, dtype=np.float64))
+        self._current = None
+
+    def clear(self):
+        self.strokes = []
+        self._current = None
+
+    def all_strokes(self):
+        """Traits terminés + trait en cours."""
+        if self._current:
+            return self.strokes + [np.array(self._current, dtype=np.float64)]
+        return list(self.strokes)
+
+    def __len__(self):
+        return len(self.all_strokes())
+
+    # ---------- Sauvegarde ----------
+
+    def to_json(self):
+        return json.dumps({"strokes": [s.tolist() for s in self.all_strokes()]})
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_json())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        recorder = cls()
+        recorder.strokes = [np.array(s, dtype=np.float64).reshape(-1, 3) for s in data["strokes"]]
+        return recorder
+
+
+def rasterize_strokes(strokes, width, height, thickness=3, background=255, ink=0):
+    """
+    Dessine les traits dans une image en niveaux de gris uint8 (height, width),
+    fond blanc et encre noire comme le canvas.
+    """
+    import cv2
+
+    img = np.full((height, width), background, dtype=np.uint8)
+    for stroke in strokes:
+        pts = np.rint(np.asarray(stroke)[:, :2]).astype(np.int32)
+        if len(pts) == 1:
+            # Simple clic : un point rond de l'épaisseur du stylo
+            cv2.circle(img, tuple(int(v) for v in pts[0]), max(1, thickness // 2), ink, -1,
+                       cv2.LINE_AA)
+        else:
+            cv2.polylines(img, [pts.reshape(-1, 1, 2)], False, ink, thickness, cv2.LINE_AA)
+    return img
+
+
+def stroke_timing(strokes):
+    """
+    Minutage de la signature : nombre de traits, durée totale, temps stylo
+    posé / levé (ms) et vitesse moyenne (px/ms) pendant le tracé.
+    """
+    strokes = [np.asarray(s) for s in strokes if len(s)]
+    if not strokes:
+        return {"strokes": 0, "duration_ms": 0.0, "pen_down_ms": 0.0,
+                "pen_up_ms": 0.0, "mean_speed": 0.0}
+    pen_down = sum(float(s[-1, 2] - s[0, 2]) for s in strokes)
+    duration = float(strokes[-1][-1, 2] - strokes[0][0, 2])
+    length = sum(float(np.hypot(*np.diff(s[:, :2], axis=0).T).sum()) for s in strokes)
+    return {
+        "strokes": len(strokes),
+        "duration_ms": duration,
+        "pen_down_ms": pen_down,
+        "pen_up_ms": max(0.0, duration - pen_down),
+        "mean_speed": length / pen_down if pen_down > 0 else 0.0,
+    }
+
+
+# --- TEST ---
+if __name__ == "__main__":
+    import cv2
+
+    rec = StrokeRecorder()
+    for i, (x, y) in enumerate([(20, 100), (80, 40), (140, 120), (200, 60)]):
+        rec.add(x, y, t=10.0 * i)
+    rec.end()
+    rec.add(250, 100, t=100.0)
+    rec.add(300, 100, t=120.0)
+    rec.end()
+    img = rasterize_strokes(rec.strokes, 400, 200)
+    cv2.imwrite("strokes_test.png", img)
+    print(f"{len(rec)} traits, {np.count_nonzero(img < 128)} pixels d'encre")
+    print(stroke_timing(rec.strokes))
@@ -0,0 +1,77 @@
+# synthetic_signatures.py
+"""
+Générateur de fausses signatures pour les bancs d'essai : traits lisses
+aléatoires (marches aléatoires lissées) dessinés en noir sur fond blanc.
+Reproductible via `seed`.
+"""
+import cv2
+import numpy as np
+
+
+def random_stroke(rng, width, height, points=40):
+    """Une courbe lisse (tableau (n, 2) de points x, y) dans l'image."""
+    start = rng.uniform((0.1 * width, 0.2 * height), (0.5 * width, 0.8 * height))
+    # Marche aléatoire à vitesse lissée : donne des boucles proches d'une écriture
+    speed = rng.normal(0, 1, (points, 2))
+    kernel = np.ones(7) / 7
+    speed[:, 0] = np.convolve(speed[:, 0], kernel, mode="same") + 0.6
+    speed[:, 1] = np.convolve(speed[:, 1], kernel, mode="same")
+    step = 0.9 * width / points
+    pts = start + np.cumsum(speed * step, axis=0)
+    pts[:, 0] = np.clip(pts[:, 0], 0, width - 1)
+    pts[:, 1] = np.clip(pts[:, 1], 0, height - 1)
+    return pts.astype(np.int32)
+
+
+def synthetic_signature(width=400, height=200, strokes=3, thickness=3, seed=None,
+                        noise=0, background=255):
+    """
+    Image BGR uint8 (height, width, 3) contenant `strokes` traits noirs.
+    thickness : épaisseur des traits en pixels (règle la densité d'encre).
+    noise : écart-type d'un bruit gaussien ajouté (papier scanné).
+    """
+    rng = np.random.default_rng(seed)
+    img = np.full((height, width, 3), background, dtype=np.uint8)
+    for _ in range(strokes):
+        pts = random_stroke(rng, width, height)
+        cv2.polylines(img, [pts], False, (0, 0, 0), int(thickness), cv2.LINE_AA)
+    if noise:
+        grain = rng.normal(0, noise, img.shape)
+        img = np.clip(img + grain, 0, 255).astype(np.uint8)
+    return img
+
+
+def ink_density(image):
+    """Proportion de pixels sombres (< 128) de l'image."""
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return float(np.count_nonzero(gray < 128)) / gray.size
+
+
+def synthetic_gallery(size, seed=0):
+    """
+    `size` références factices {"name", "features"} aux features de base
+    plausibles (width, height, black_pixels), sans générer d'images.
+    """
+    rng = np.random.default_rng(seed)
+    widths = rng.integers(150, 1200, size)
+    heights = (widths * rng.uniform(0.25, 0.8, size)).astype(int)
+    black = (widths * heights * rng.uniform(0.01, 0.08, size)).astype(int)
+    return [
+        {
+            "name": f"synthetic_{i:06d}",
+            "features": {
+                "width": int(w),
+                "height": int(h),
+                "black_pixels": int(b),
+            },
+        }
+        for i, (w, h, b) in enumerate(zip(widths, heights, black))
+    ]
+
+
+if __name__ == "__main__":
+    for i, (w, h, t) in enumerate([(400, 200, 2), (400, 200, 6), (1200, 600, 4)]):
+        img = synthetic_signature(w, h, thickness=t, seed=i)
+        name = f"synthetic_{i}.png"
+        cv2.imwrite(name, img)
+        print(f"{name}: {w}x{h}, densité d'encre {ink_density(img):.1%}")
@@ -0,0 +1,226 @@
+# thinning.py
+"""
+Amincissement (squelettisation) sans opencv-contrib.
+
+Zhang-Suen et Guo-Hall par table de correspondance : pour chaque pixel on
+calcule un code 8 bits de ses voisins (P2..P9) en une passe vectorisée,
+puis une table de 256 entrées dit si le pixel doit être supprimé.
+Les codes sont calculés une fois puis mis à jour sur place.
+
+`python thinning.py [image]` compare les moteurs (temps et accord).
+
+Convention : pixels du trait != 0, fond = 0 (comme ximgproc.thinning).
+"""
+import numpy as np
+
+# Décalages (dy, dx) des voisins P2..P9, dans le sens horaire depuis le nord.
+# Le voisin n° i correspond au bit i du code.
+NEIGHBOURS = (
+    (-1, 0),   # P2 nord
+    (-1, 1),   # P3 nord-est
+    (0, 1),    # P4 est
+    (1, 1),    # P5 sud-est
+    (1, 0),    # P6 sud
+    (1, -1),   # P7 sud-ouest
+    (0, -1),   # P8 ouest
+    (-1, -1),  # P9 nord-ouest
+)
+
+
+# -------- Tables de correspondance --------
+
+def _bits(code):
+    """Code 8 bits -> (P2, P3, ..., P9)."""
+    return [(code >> i) & 1 for i in range(8)]
+
+
+def _zhang_suen_lut(step):
+    lut = np.zeros(256, dtype=np.uint8)
+    for code in range(256):
+        p2, p3, p4, p5, p6, p7, p8, p9 = p = _bits(code)
+        b = sum(p)
+        # nombre de transitions 0 -> 1 dans la séquence P2, P3, ..., P9, P2
+        a = sum(1 for i in range(8) if p[i] == 0 and p[(i + 1) % 8] == 1)
+        if step == 0:
+            m1, m2 = p2 * p4 * p6, p4 * p6 * p8
+        else:
+            m1, m2 = p2 * p4 * p8, p2 * p6 * p8
+        if 2 <= b <= 6 and a == 1 and m1 == 0 and m2 == 0:
+            lut[code] = 1
+    return lut
+
+
+def _guo_hall_lut(step):
+    lut = np.zeros(256, dtype=np.uint8)
+    for code in range(256):
+        p2, p3, p4, p5, p6, p7, p8, p9 = _bits(code)
+        c = ((not p2) & (p3 | p4)) + ((not p4) & (p5 | p6)) \
+            + ((not p6) & (p7 | p8)) + ((not p8) & (p9 | p2))
+        n1 = (p9 | p2) + (p3 | p4) + (p5 | p6) + (p7 | p8)
+        n2 = (p2 | p3) + (p4 | p5) + (p6 | p7) + (p8 | p9)
+        n = min(n1, n2)
+        if step == 0:
+            m = (p6 | p7 | (not p9)) & p8
+        else:
+            m = (p2 | p3 | (not p5)) & p4
+        if c == 1 and 2 <= n <= 3 and m == 0:
+            lut[code] = 1
+    return lut
+
+
+_LUTS = {
+    "zhang-suen": (_zhang_suen_lut(0), _zhang_suen_lut(1)),
+    "guo-hall": (_guo_hall_lut(0), _guo_hall_lut(1)),
+}
+
+
+# -------- Moteurs --------
+
+def thin_lut(image, method="zhang-suen", max_iter=None):
+    """
+    Amincissement itératif par table de correspondance.
+    image : tableau 2D, trait != 0. Retourne un squelette uint8 0/255.
+
+    Les codes de voisinage sont calculés une seule fois pour toute l'image,
+    puis mis à jour localement : supprimer un pixel efface un bit dans le
+    code de ses 8 voisins. Chaque sous-itération ne coûte donc qu'une lecture
+    des pixels du trait restants, plus un travail proportionnel aux pixels
+    supprimés, quelle que soit la taille de l'image.
+    """
+    luts = _LUTS[method]
+    fg = np.asarray(image) != 0
+    h, w = fg.shape
+    if not fg.any():
+        return np.zeros((h, w), dtype=np.uint8)
+
+    # Image 0/1 entourée d'une bordure de fond : aucun test de bord à faire
+    buf = np.zeros((h + 2, w + 2), dtype=np.uint8)
+    buf[1:-1, 1:-1] = fg
+
+    # Codes de voisinage initiaux (une passe sur l'image entière)
+    codes = np.zeros_like(buf)
+    inner = codes[1:-1, 1:-1]
+    for bit, (dy, dx) in enumerate(NEIGHBOURS):
+        inner |= buf[1 + dy:h + 1 + dy, 1 + dx:w + 1 + dx] << bit
+    flat_codes = codes.ravel()
+    flat = buf.ravel()
+
+    offsets = [dy * (w + 2) + dx for dy, dx in NEIGHBOURS]
+    # Supprimer le pixel p efface, chez son voisin p + offsets[k], le bit du
+    # voisin opposé (k + 4) qui désigne p
+    clear_masks = [np.uint8(0xFF ^ (1 << ((k + 4) % 8))) for k in range(8)]
+
+    idx = np.flatnonzero(flat)
+    iteration = 0
+    while max_iter is None or iteration < max_iter:
+        changed = False
+        for lut in luts:
+            removed = lut[flat_codes[idx]].view(bool)
+            if not removed.any():
+                continue
+            # Suppression parallèle : les codes ont tous été lus avant
+            gone = idx[removed]
+            idx = idx[~removed]
+            flat[gone] = 0
+            for off, mask in zip(offsets, clear_masks):
+                flat_codes[gone + off] &= mask
+            changed = True
+        iteration += 1
+        if not changed:
+            break
+
+    return buf[1:-1, 1:-1] * np.uint8(255)
+
+
+def thin_morphological(image):
+    """
+    Ancien repli de preprocessing.skeletonize_image :
+    squelette morphologique par érosions / ouvertures successives.
+    """
+    import cv2
+
+    img = (np.asarray(image) != 0).astype(np.uint8) * 255
+    skel = np.zeros_like(img)
+    element = cv2.getStructuringElement(cv2.MORPH_CROSS, (3, 3))
+
+    while True:
+        eroded = cv2.erode(img, element)
+        temp = cv2.dilate(eroded, element)
+        temp = cv2.subtract(img, temp)
+        skel = cv2.bitwise_or(skel, temp)
+        img = eroded.copy()
+
+        if cv2.countNonZero(img) == 0:
+            break
+    return skel
+
+
+def thin_ximgproc(image):
+    """cv2.ximgproc.thinning (opencv-contrib). Lève ImportError si absent."""
+    import cv2.ximgproc as ximgproc
+    return ximgproc.thinning((np.asarray(image) != 0).astype(np.uint8) * 255)
+
+
+METHODS = {
+    "ximgproc": thin_ximgproc,
+    "zhang-suen": lambda image: thin_lut(image, "zhang-suen"),
+    "guo-hall": lambda image: thin_lut(image, "guo-hall"),
+    "morphological": thin_morphological,
+}
+
+
+def has_ximgproc():
+    try:
+        import cv2.ximgproc  # noqa: F401
+        return True
+    except Exception:
+        return False
+
+
+def thin(image, method=None):
+    """
+    Amincit une image (trait != 0) avec le moteur demandé.
+    method=None : ximgproc si disponible, sinon Zhang-Suen intégré.
+    """
+    if method is None:
+        method = "ximgproc" if has_ximgproc() else "zhang-suen"
+    try:
+        engine = METHODS[method]
+    except KeyError:
+        raise ValueError(f"Méthode d'amincissement inconnue : {method}")
+    return engine(image)
+
+
+# -------- Banc d'essai --------
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    import cv2
+
+    path = sys.argv[1] if len(sys.argv) > 1 else "image_test.png"
+    gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        sys.exit(f"Image introuvable : {path}")
+    _, ink = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY_INV)
+
+    methods = ["morphological", "zhang-suen", "guo-hall"]
+    if has_ximgproc():
+        methods.insert(0, "ximgproc")
+
+    for scale in (1, 2, 4):
+        img = cv2.resize(ink, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
+        print(f"\n{img.shape[1]}x{img.shape[0]} px")
+        ref = thin(img, methods[0] if methods[0] == "ximgproc" else "zhang-suen")
+        for name in methods:
+            thin(img, name)  # échauffement
+            runs = 5
+            t0 = time.perf_counter()
+            for _ in range(runs):
+                skel = thin(img, name)
+            ms = 1000 * (time.perf_counter() - t0) / runs
+            # Accord avec la référence : pixels de squelette à <= 1 px près
+            near = cv2.dilate(ref, np.ones((3, 3), np.uint8))
+            agree = np.count_nonzero(skel & near) / max(1, np.count_nonzero(skel))
+            print(f"  {name:14s} {ms:9.2f} ms  {np.count_nonzero(skel):7d} px  accord {agree:.1%}")
@@ -1,13 +1,25 @@
 import logging
+import time
 
-from preprocessing import preprocess_signature
+from preprocessing import describe_source, preprocess_signature
 from features import extract_features
+from reference_cache import get_reference
+from reference_db import is_match
+from metrics import metrics
+from audit_log import audit_event, get_audit_logger
+from result_memo import memo_key
 
-logging.basicConfig(
-    filename="verification.log",
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-)
+# Propriétaire par défaut (historique : une seule personne enrôlée)
+DEFAULT_OWNER = "Selsabil"
+
+# Messages d'échec : l'image n'a pas pu être jugée (ni match ni rejet)
+ERROR_PREPROCESS = "Erreur : impossible de prétraiter l'image."
+ERROR_TOO_SMALL = "Erreur : image trop petite pour une vérification fiable."
+
+
+def is_error_message(message):
+    """True si `message` est un échec de vérification, pas une décision."""
+    return message.startswith("Erreur")
 
 
 def compute_distance(ref_features, test_features):
@@ -20,46 +32,112 @@ def compute_distance(ref_features, test_features):
     return (dx ** 2 + dy ** 2 + db ** 2) ** 0.5
 
 
-def verify_signature(input_image_path, reference_path, threshold=1000.0):
+def describe_references(reference_path):
+    """describe_source d'une référence ou de chaque échantillon d'une liste."""
+    if isinstance(reference_path, (list, tuple)):
+        return [describe_source(ref) for ref in reference_path]
+    return describe_source(reference_path)
+
+
+def verify_signature(input_image_path, reference_path, threshold=1000.0, owner=DEFAULT_OWNER,
+                     memo=None):
     """
+    input_image_path, reference_path : chemin, octets encodés ou tableau NumPy
+    (une image déjà décodée n'est pas relue depuis le disque).
+    reference_path peut aussi être une liste d'échantillons du même
+    propriétaire : on garde la plus petite distance.
+    owner : nom affiché dans le message en cas de correspondance.
+    memo : ResultMemo (result_memo.py) ; une soumission identique (même
+    contenu, mêmes références, seuil et propriétaire) renvoie le résultat
+    mémorisé sans repasser dans le pipeline.
     Retourne (match: bool, message: str)
     """
-
-    logging.info("Début vérification")
-    logging.info(f"Image entrée   : {input_image_path}")
-    logging.info(f"Image référence: {reference_path}")
-
-    # 1) Prétraitement des deux images
+    if memo is None:
+        return _verify(input_image_path, reference_path, threshold, owner)
+
+    try:
+        key = memo_key(input_image_path, reference_path, threshold, owner=owner)
+    except OSError:
+        # Fichier introuvable : pas de clé, l'erreur est rapportée normalement
+        return _verify(input_image_path, reference_path, threshold, owner)
+    cached = memo.get(key)
+    if cached is not None:
+        metrics.inc("memo_hits")
+        log = get_audit_logger()
+        if log.isEnabledFor(logging.INFO):
+            audit_event(log, logging.INFO, "verification_memo",
+                        input=describe_source(input_image_path),
+                        reference=describe_references(reference_path),
+                        owner=owner, threshold=threshold,
+                        result="MATCH" if cached[0] else "NO MATCH")
+        return cached[0], cached[1]
+    metrics.inc("memo_misses")
+    match, msg = _verify(input_image_path, reference_path, threshold, owner)
+    if not is_error_message(msg):
+        # Un échec n'est pas mémorisé : le renvoi est réessayé
+        memo.put(key, [match, msg])
+    return match, msg
+
+
+def _verify(input_image_path, reference_path, threshold, owner):
+    metrics.inc("verifications")
+    log = get_audit_logger()
+    t0 = time.perf_counter()
+
+    # 1) Prétraitement de l'image d'entrée ; la référence vient du cache
     roi_in, w_in, h_in = preprocess_signature(input_image_path)
-    roi_ref, w_ref, h_ref = preprocess_signature(reference_path)
+    samples = reference_path if isinstance(reference_path, (list, tuple)) else [reference_path]
+    with metrics.stage("reference"):
+        refs = [get_reference(ref) for ref in samples]
 
-    if roi_in is None or roi_ref is None:
-        logging.error("Prétraitement impossible (ROI None).")
-        return False, "Erreur : impossible de prétraiter l'image."
+    if roi_in is None or not refs or any(r[0] is None for r in refs):
+        metrics.inc("errors")
+        audit_event(log, logging.ERROR, "pretraitement_impossible",
+                    input=describe_source(input_image_path),
+                    reference=describe_references(reference_path))
+        return False, ERROR_PREPROCESS
 
     # 2) Image trop petite ?
     if w_in < 50 or h_in < 50:
-        logging.warning("Image trop petite")
-        return False, "Erreur : image trop petite pour une vérification fiable."
+        metrics.inc("too_small")
+        audit_event(log, logging.WARNING, "image_trop_petite",
+                    input=describe_source(input_image_path), width=w_in, height=h_in)
+        return False, ERROR_TOO_SMALL
 
     # 3) Extraction des caractéristiques
-    feat_input = extract_features(roi_in, w_in, h_in)
-    feat_ref = extract_features(roi_ref, w_ref, h_ref)
-
-    logging.info(f"Features ref : {feat_ref}")
-    logging.info(f"Features in  : {feat_input}")
+    with metrics.stage("features"):
+        feat_input = extract_features(roi_in, w_in, h_in)
 
     # 4) Distance + décision
-    dist = compute_distance(feat_ref, feat_input)
-    logging.info(f"Distance = {dist:.2f} (seuil = {threshold})")
-
-    if dist <= threshold:
-        msg = " C'EST LA SIGNATURE DE SELSABIL !"
-        logging.info("Résultat : MATCH")
+    with metrics.stage("distance"):
+        dist, feat_ref = min(
+            ((compute_distance(r[3], feat_input), r[3]) for r in refs),
+            key=lambda pair: pair[0],
+        )
+    match = is_match(dist, threshold)
+
+    # 5) Journal d'audit : un seul événement structuré par vérification
+    if log.isEnabledFor(logging.INFO):
+        audit_event(
+            log, logging.INFO, "verification",
+            input=describe_source(input_image_path),
+            reference=describe_references(reference_path),
+            owner=owner,
+            features_ref=feat_ref,
+            features_in=feat_input,
+            distance=round(dist, 2),
+            threshold=threshold,
+            result="MATCH" if match else "NO MATCH",
+            duration_ms=round(1000 * (time.perf_counter() - t0), 3),
+        )
+
+    if match:
+        metrics.inc("matches")
+        msg = f" C'EST LA SIGNATURE DE {owner.upper()} !"
         return True, msg
     else:
+        metrics.inc("rejections")
         msg = "Signature non reconnue."
-        logging.info("Résultat : NO MATCH")
         return False, msg
 
 